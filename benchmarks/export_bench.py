@@ -0,0 +1,96 @@
+# times loader.load + loader.export against a throwaway database for growing
+# synthetic GOOD accounts, to check that import time scales with roster size
+#
+#   python benchmarks/export_bench.py [counts...]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import loader
+
+SLOTS = ["flower", "plume", "sands", "goblet", "circlet"]
+MAIN_STATS = {
+    "flower": "hp",
+    "plume": "atk",
+    "sands": "atk_",
+    "goblet": "pyro_dmg_",
+    "circlet": "critRate_",
+}
+
+
+def make_good(count: int) -> dict:
+    db = {"format": "GOOD", "characters": [], "weapons": [], "artifacts": []}
+    for i in range(count):
+        key = f"Character{i}"
+        db["characters"].append(
+            {
+                "key": key,
+                "id": key,
+                "level": 90,
+                "ascension": 6,
+                "constellation": i % 7,
+                "talent": {"auto": 9, "skill": 9, "burst": 9},
+            }
+        )
+        db["weapons"].append(
+            {
+                "key": "StaffOfHoma",
+                "level": 90,
+                "ascension": 6,
+                "refinement": 1,
+                "location": key,
+            }
+        )
+        for slot in SLOTS:
+            db["artifacts"].append(
+                {
+                    "setKey": "CrimsonWitchOfFlames",
+                    "rarity": 5,
+                    "level": 20,
+                    "slotKey": slot,
+                    "mainStatKey": MAIN_STATS[slot],
+                    "location": key,
+                    "substats": [
+                        {"key": "critDMG_", "value": 14.0},
+                        {"key": "critRate_", "value": 7.0},
+                        {"key": "atk_", "value": 5.8},
+                        {"key": "eleMas", "value": 23.0},
+                    ],
+                }
+            )
+    return db
+
+
+def bench(count: int, incremental: bool = False, repeat: int = 5) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loader.load(make_good(count))
+        loader.export(incremental=incremental)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    counts = [int(x) for x in sys.argv[1:]] or [10, 30, 90, 180, 360]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        loader.create_table()
+        print(
+            f"{'characters':>10} {'full ms':>10} {'ms/char':>10} {'unchanged ms':>13}"
+        )
+        for count in counts:
+            elapsed = bench(count)
+            # re-importing the same account only has to compare fingerprints
+            unchanged = bench(count, incremental=True)
+            print(
+                f"{count:>10} {elapsed * 1000:>10.2f} {elapsed * 1000 / count:>10.3f} {unchanged * 1000:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+# headless entry point, for machines without a display. must not import tkinter
+import argparse
+import json
+import os
+import sys
+
+import db
+import jobs
+import loader
+import maker
+import results
+import runner
+import worker
+
+maindir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def import_command(args: argparse.Namespace) -> int:
+    with open(args.file, "r") as f:
+        good = json.load(f)
+
+    if good.get("format") != "GOOD":
+        print("Incorrect database format.", file=sys.stderr)
+        return 1
+
+    try:
+        loader.load(good)
+    except KeyError as e:
+        print(f"Error importing character data: missing key {e}.", file=sys.stderr)
+        return 1
+
+    summary = loader.export(incremental=not args.full)
+    maker.invalidateCharConfigs(loader.dirty_characters)
+    print(
+        f"{len(summary['added'])} added, {len(summary['updated'])} updated, "
+        f"{len(summary['removed'])} removed, {len(summary['unchanged'])} unchanged."
+    )
+    return 0
+
+
+def list_command(args: argparse.Namespace) -> int:
+    queries = {
+        "characters": "SELECT name FROM Characters ORDER BY name ASC",
+        "character-configs": "SELECT config_name FROM Character_Configs",
+        "rotations": "SELECT config_name FROM Rotation_Configs",
+        "full-configs": "SELECT config_name FROM Full_Configs",
+    }
+    with db.get_connection() as con:
+        for (name,) in con.execute(queries[args.what]):
+            print(name)
+    return 0
+
+
+def save_character_command(args: argparse.Namespace) -> int:
+    with db.get_connection() as con:
+        row = con.execute(
+            "SELECT 1 FROM Characters WHERE name = ?", (args.character,)
+        ).fetchone()
+    if not row:
+        print(f"Character {args.character} not found.", file=sys.stderr)
+        return 1
+    maker.saveConfig(args.character, args.name)
+    return 0
+
+
+def regenerate_command(args: argparse.Namespace) -> int:
+    regenerated = maker.regenerateConfigs()
+    for name in regenerated:
+        print(name)
+    print(f"{len(regenerated)} character config(s) regenerated.")
+    return 0
+
+
+def refresh_command(args: argparse.Namespace) -> int:
+    refreshed = maker.refreshStaleConfigs()
+    for name in refreshed:
+        print(name)
+    print(f"{len(refreshed)} stale character config(s) refreshed.")
+    return 0
+
+
+def diff_command(args: argparse.Namespace) -> int:
+    changed = maker.diffSavedConfigs(args.configs or None)
+    for name, changes in changed.items():
+        print(f"{name}:")
+        if isinstance(changes, str):
+            print(f"  {changes}")
+            continue
+        for change in changes:
+            print(f"  {change}")
+    print(f"{len(changed)} saved character config(s) differ from the import.")
+    return 0
+
+
+def save_rotation_command(args: argparse.Namespace) -> int:
+    if args.file == "-":
+        config = sys.stdin.read()
+    else:
+        with open(args.file, "r", encoding="utf-8") as f:
+            config = f.read()
+    maker.saveRotationConfig(args.name, config)
+    return 0
+
+
+def save_full_command(args: argparse.Namespace) -> int:
+    if len(args.characters) > 4:
+        print("A team has at most 4 characters.", file=sys.stderr)
+        return 1
+    maker.saveFullConfig(args.name, args.characters, args.rotation)
+    return 0
+
+
+def check_exe(args: argparse.Namespace) -> bool:
+    # gcsim only has to be here when the sims don't go to workers
+    if args.remote or os.path.isfile(args.exe or ""):
+        return True
+    print("GCSim executable not found.", file=sys.stderr)
+    return False
+
+
+def run_command(args: argparse.Namespace) -> int:
+    if not check_exe(args):
+        return 1
+
+    names = args.configs
+    if not names and not args.all:
+        print("Name the configs to run, or pass --all.", file=sys.stderr)
+        return 1
+    if args.all:
+        with db.get_connection() as con:
+            names = [x for (x,) in con.execute("SELECT config_name FROM Full_Configs")]
+        if not names:
+            print("No full configs saved.", file=sys.stderr)
+            return 1
+
+    try:
+        configs = maker.makeFullConfigs(names)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+
+    options = runner.make_options_string(
+        not args.no_optimizer,
+        not args.no_fine_tune,
+        args.liquid_substats,
+        args.liquid_cap,
+        args.fixed_substats,
+    )
+
+    batch = jobs.create_batch(configs, options)
+    return run_jobs(args, jobs.get_jobs("WHERE batch = ?", (batch,)))
+
+
+def run_jobs(args: argparse.Namespace, job_list: list[dict]) -> int:
+    def on_result(name: str, result: dict):
+        if result.get("skipped"):
+            print(f"==> {name} (skipped)")
+            return
+        if result.get("stopped"):
+            status = result["stopped"]
+        elif result.get("cached"):
+            status = "cached"
+        else:
+            status = f"exit {result['returncode']}"
+        print(f"==> {name} ({status})")
+        if not args.quiet:
+            print(result["output"])
+
+    os.makedirs(args.out, exist_ok=True)
+    try:
+        finished = jobs.run_jobs(
+            args.exe,
+            job_list,
+            args.out,
+            workers=args.workers,
+            use_cache=not args.no_cache,
+            on_result=on_result,
+            timeout=args.timeout or None,
+            remote=runner.parse_addresses(args.remote or ""),
+        )
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("Cancelled, jobs that hadn't started can be resumed.", file=sys.stderr)
+        return 130
+
+    failed = [name for name, result in finished.items() if result["returncode"] != 0]
+    if failed:
+        print(f"Simulation failed for {', '.join(failed)}.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def resume_command(args: argparse.Namespace) -> int:
+    if not check_exe(args):
+        return 1
+
+    job_list = jobs.unfinished()
+    if not job_list:
+        print("No unfinished simulations to resume.")
+        return 0
+    print(f"Resuming {len(job_list)} simulation(s) from batch {job_list[0]['batch']}.")
+    return run_jobs(args, job_list)
+
+
+def worker_command(args: argparse.Namespace) -> int:
+    if not os.path.isfile(args.exe):
+        print("GCSim executable not found.", file=sys.stderr)
+        return 1
+    try:
+        worker.serve(args.exe, args.host, args.port, args.slots, args.token)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def jobs_command(args: argparse.Namespace) -> int:
+    for job in jobs.latest_batch():
+        print(f"{job['batch']:>4}  {job['state']:<8}  {job['config_name']}")
+    return 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    names = None if args.all else args.configs
+    if not names and not args.all:
+        print("Name the configs to export, or pass --all.", file=sys.stderr)
+        return 1
+
+    try:
+        manifest = maker.exportFullConfigs(args.out, names, args.workers)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+
+    print(f"{len(manifest)} config(s) exported to {os.path.abspath(args.out)}.")
+    return 0
+
+
+def results_command(args: argparse.Namespace) -> int:
+    def number(value: float | None) -> str:
+        return "-" if value is None else f"{value:.2f}"
+
+    for row in results.ranking(args.limit, args.configs or None):
+        print(
+            f"{number(row['dps_mean']):>12}  {row['config_name']}  "
+            f"(min {number(row['dps_min'])}, max {number(row['dps_max'])}, std {number(row['dps_std'])}, "
+            f"{row['iterations']} iterations, {row['created']})"
+        )
+        if args.characters:
+            for character in results.character_results(row["id"]):
+                print(f"{number(character['dps_mean']):>16}  {character['character']}")
+    return 0
+
+
+def ingest_command(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.dir):
+        print(f"{args.dir} is not a directory.", file=sys.stderr)
+        return 1
+    stored = results.ingest_directory(args.dir)
+    print(f"{len(stored)} result(s) stored.")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="GCSim Config Creator without the GUI."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="import a GOOD json export")
+    p.add_argument("file")
+    p.add_argument(
+        "--full", action="store_true", help="rebuild the import tables from scratch"
+    )
+    p.set_defaults(func=import_command)
+
+    p = commands.add_parser("list", help="list stored characters or configs")
+    p.add_argument(
+        "what",
+        choices=["characters", "character-configs", "rotations", "full-configs"],
+    )
+    p.set_defaults(func=list_command)
+
+    p = commands.add_parser(
+        "save-character", help="save a character config from the imported gear"
+    )
+    p.add_argument("character", help="GOOD character id, e.g. HuTao")
+    p.add_argument("name", help="config name")
+    p.set_defaults(func=save_character_command)
+
+    p = commands.add_parser(
+        "regenerate", help="rebuild every saved character config from the import"
+    )
+    p.set_defaults(func=regenerate_command)
+
+    p = commands.add_parser(
+        "refresh", help="rebuild the saved character configs whose gear changed"
+    )
+    p.set_defaults(func=refresh_command)
+
+    p = commands.add_parser(
+        "diff", help="show how saved character configs differ from the import"
+    )
+    p.add_argument("configs", nargs="*", metavar="CONFIG")
+    p.set_defaults(func=diff_command)
+
+    p = commands.add_parser("save-rotation", help="save a rotation from a file")
+    p.add_argument("name")
+    p.add_argument("file", help="rotation file, or - for stdin")
+    p.set_defaults(func=save_rotation_command)
+
+    p = commands.add_parser("save-full", help="save a team config")
+    p.add_argument("name")
+    p.add_argument("--rotation", required=True)
+    p.add_argument("--characters", nargs="+", required=True, metavar="CONFIG")
+    p.set_defaults(func=save_full_command)
+
+    p = commands.add_parser("run", help="simulate full configs")
+    p.add_argument("configs", nargs="*", metavar="CONFIG")
+    p.add_argument("--all", action="store_true", help="run every full config")
+    p.add_argument("--exe", help="path to the gcsim executable")
+    p.add_argument("--out", default=os.path.join(maindir, "out"))
+    p.add_argument(
+        "--workers", type=int, default=None, help="parallel sims, default per cpu"
+    )
+    p.add_argument(
+        "--remote", metavar="HOST:PORT,...", help="run the sims on these workers"
+    )
+    p.add_argument("--no-cache", action="store_true")
+    p.add_argument(
+        "--timeout", type=float, default=0, help="seconds per sim, 0 for no limit"
+    )
+    p.add_argument("--no-optimizer", action="store_true")
+    p.add_argument("--no-fine-tune", action="store_true")
+    p.add_argument("--liquid-substats", type=int, default=20)
+    p.add_argument("--liquid-cap", type=int, default=10)
+    p.add_argument("--fixed-substats", type=int, default=2)
+    p.add_argument("--quiet", action="store_true", help="don't print gcsim output")
+    p.set_defaults(func=run_command)
+
+    p = commands.add_parser(
+        "resume", help="run the unfinished jobs of the last interrupted batch"
+    )
+    p.add_argument("--exe", help="path to the gcsim executable")
+    p.add_argument("--out", default=os.path.join(maindir, "out"))
+    p.add_argument(
+        "--workers", type=int, default=None, help="parallel sims, default per cpu"
+    )
+    p.add_argument(
+        "--remote", metavar="HOST:PORT,...", help="run the sims on these workers"
+    )
+    p.add_argument("--no-cache", action="store_true")
+    p.add_argument(
+        "--timeout", type=float, default=0, help="seconds per sim, 0 for no limit"
+    )
+    p.add_argument("--quiet", action="store_true", help="don't print gcsim output")
+    p.set_defaults(func=resume_command)
+
+    p = commands.add_parser("worker", help="run sims sent by other machines")
+    p.add_argument("--exe", required=True, help="path to the gcsim executable")
+    p.add_argument(
+        "--host", default="127.0.0.1", help="address to listen on, 0.0.0.0 for all"
+    )
+    p.add_argument("--port", type=int, default=runner.DEFAULT_WORKER_PORT)
+    p.add_argument("--slots", type=int, default=runner.default_workers())
+    p.add_argument(
+        "--token",
+        default=os.environ.get("GCSIM_WORKER_TOKEN"),
+        help="shared secret, GCSIM_WORKER_TOKEN by default",
+    )
+    p.set_defaults(func=worker_command)
+
+    p = commands.add_parser("jobs", help="show the state of the last batch")
+    p.set_defaults(func=jobs_command)
+
+    p = commands.add_parser("results", help="rank stored simulation results")
+    p.add_argument("configs", nargs="*", metavar="CONFIG")
+    p.add_argument("--limit", type=int, default=None)
+    p.add_argument(
+        "--characters", action="store_true", help="show per-character dps too"
+    )
+    p.set_defaults(func=results_command)
+
+    p = commands.add_parser(
+        "ingest", help="store the gcsim result files in a directory"
+    )
+    p.add_argument("dir", nargs="?", default=os.path.join(maindir, "out"))
+    p.set_defaults(func=ingest_command)
+
+    p = commands.add_parser(
+        "export", help="write full configs and a manifest to a directory"
+    )
+    p.add_argument("configs", nargs="*", metavar="CONFIG")
+    p.add_argument("--all", action="store_true", help="export every full config")
+    p.add_argument("--out", default=os.path.join(maindir, "export"))
+    p.add_argument("--workers", type=int, default=runner.default_workers())
+    p.set_defaults(func=export_command)
+
+    return parser
+
+
+def main(argv: list[str]) -> int:
+    args = build_parser().parse_args(argv)
+    loader.create_table()
+    return args.func(args)
@@ -0,0 +1,30 @@
+# shared access to configs.db. every thread keeps one long-lived connection, so
+# the schema is parsed once and sqlite's statement cache survives between calls
+import sqlite3
+import threading
+
+DB_PATH = "configs.db"
+
+local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    # use as `with db.get_connection() as con:`, which commits (or rolls back)
+    # on exit but leaves the connection open for the next caller
+    con = getattr(local, "con", None)
+    if con is None:
+        con = sqlite3.connect(DB_PATH, cached_statements=256)
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        con.execute("PRAGMA temp_store = MEMORY")
+        con.execute("PRAGMA cache_size = -16000")
+        con.execute("PRAGMA mmap_size = 268435456")
+        local.con = con
+    return con
+
+
+def close_connection():
+    con = getattr(local, "con", None)
+    if con is not None:
+        con.close()
+        local.con = None
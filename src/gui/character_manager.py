@@ -1,8 +1,8 @@
-import sqlite3
 from tkinter import *
 from tkinter import messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 
+import db
 import util
 
 
@@ -15,10 +15,9 @@ def refresh_textbox(display_config: ScrolledText, tree: ttk.Treeview):
 
 
 def refresh_treeview(tree: ttk.Treeview):
-    with sqlite3.connect("configs.db") as con:
-        con.row_factory = util.dict_factory
-
+    with db.get_connection() as con:
         cursor = con.cursor()
+        cursor.row_factory = util.dict_factory
 
         rows = cursor.execute(
             """
@@ -64,7 +63,7 @@ def delete_char_config(display_config: ScrolledText, tree: ttk.Treeview):
     )
 
     if answer:
-        with sqlite3.connect("configs.db") as con:
+        with db.get_connection() as con:
             cursor = con.cursor()
             cursor.execute(
                 """
@@ -104,7 +103,7 @@ def rename_char_config(root: Tk, display_config: ScrolledText, tree: ttk.Treevie
         def save_new_name():
             new_name = entry.get()
             if new_name:  # Ensure the new name isn't empty
-                with sqlite3.connect("configs.db") as con:
+                with db.get_connection() as con:
                     cursor = con.cursor()
                     cursor.execute(
                         """
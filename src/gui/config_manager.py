@@ -1,9 +1,11 @@
-import sqlite3
 from tkinter import *
 from tkinter import messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 from typing import Literal
 
+import db
+import maker
+
 from .import_manager import get_character_config_list
 from .rotation_manager import get_rotation_config_list
 
@@ -43,7 +45,7 @@ def refresh_preview(
 
     info_list = []
 
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         char_configs = []
@@ -112,7 +114,7 @@ def save_full_config(
     if not save_name.get():
         return
     characters = [x.get() if x.get() else None for x in characters]
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         # warning messagebox for existing name
@@ -132,12 +134,8 @@ def save_full_config(
             if not res:
                 return
 
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO Full_Configs (config_name, rotation, character1, character2, character3, character4)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (save_name.get(), rotation.get() if rotation.get() else None, *characters),
+        maker.saveFullConfig(
+            save_name.get(), characters, rotation.get() if rotation.get() else None
         )
         timed_info_label(
             sidebar_frame, info_label, f"Config {save_name.get()} saved.", "success"
@@ -145,7 +143,7 @@ def save_full_config(
 
 
 def get_full_config_list() -> list[str]:
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -166,7 +164,7 @@ def delete_full_config(
     if not listbox.get():
         return
 
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -198,7 +196,7 @@ def load_full_config(
     if not listbox.get():
         return
 
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         cursor.execute(
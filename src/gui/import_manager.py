@@ -1,13 +1,14 @@
 import json
 import os
-import sqlite3
 from tkinter import *
 from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 from typing import Literal
 
+import db
 import loader
 import maker
+import model
 
 from .character_manager import refresh_character_manager_tree
 
@@ -34,7 +35,7 @@ def timed_info_label(
 
 
 def refresh_character_list(tree: ttk.Treeview):
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """
@@ -72,7 +73,7 @@ def refresh_old_config(config_name: StringVar, mode: str, old_config: ScrolledTe
     old_config.delete("1.0", "end")
 
     if config_name.get():
-        with sqlite3.connect("configs.db") as con:
+        with db.get_connection() as con:
             cursor = con.cursor()
             cursor.execute(
                 """
@@ -89,8 +90,53 @@ def refresh_old_config(config_name: StringVar, mode: str, old_config: ScrolledTe
     old_config.configure(state="disabled")
 
 
+def set_diff_output(diff_output: ScrolledText, text: str):
+    diff_output.configure(state="normal")
+    diff_output.delete("1.0", "end")
+    diff_output.insert("1.0", text)
+    diff_output.configure(state="disabled")
+
+
+def refresh_diff(
+    old_config: ScrolledText, new_config: ScrolledText, diff_output: ScrolledText
+):
+    # runs on every edit, so half-typed blocks are normal here
+    try:
+        old = model.parse(old_config.get("1.0", "end-1c"))
+        new = model.parse(new_config.get("1.0", "end-1c"))
+    except ValueError as e:
+        set_diff_output(diff_output, f"Unreadable config: {e}")
+        return
+    if not old or not new:
+        set_diff_output(diff_output, "")
+        return
+    changes = model.diff(old[0], new[0])
+    set_diff_output(diff_output, model.format_changes(changes) or "No changes.")
+
+
+def check_saved_configs_handler(
+    diff_output: ScrolledText, sidebar_frame: ttk.Frame, info_label: ttk.Label
+):
+    changed = maker.diffSavedConfigs()
+    lines = []
+    for name, changes in changed.items():
+        lines.append(f"{name}:")
+        if isinstance(changes, str):
+            lines.append(f"  {changes}")
+            continue
+        lines.extend(f"  {change}" for change in changes)
+    set_diff_output(diff_output, "\n".join(lines))
+
+    timed_info_label(
+        sidebar_frame,
+        info_label,
+        f"{len(changed)} saved character config(s) differ from the import.",
+        "success" if not changed else "info",
+    )
+
+
 def get_character_config_list() -> list[str]:
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -182,12 +228,16 @@ def load_button_handler(
             10000,
         )
         return
-    loader.export()
+    summary = loader.export(incremental=True)
+    maker.invalidateCharConfigs(loader.dirty_characters)
     refresh_character_list(tree)
     refresh_new_config(new_config, tree)
 
     timed_info_label(
-        sidebar_frame, info_label, "Character(s) imported successfully.", "success"
+        sidebar_frame,
+        info_label,
+        f"Character(s) imported successfully: {len(summary['added'])} added, {len(summary['updated'])} updated, {len(summary['removed'])} removed, {len(summary['unchanged'])} unchanged.",
+        "success",
     )
 
 
@@ -202,7 +252,7 @@ def save_character_config(
         return
 
     # warning messagebox for existing name
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         # warning messagebox for existing name
@@ -231,6 +281,37 @@ def save_character_config(
     )
 
 
+def regenerate_configs_handler(sidebar_frame: ttk.Frame, info_label: ttk.Label):
+    res = messagebox.askokcancel(
+        "Regenerate Configs",
+        "Every saved character config will be rebuilt from the currently imported gear. Proceed?",
+    )
+    if not res:
+        return
+
+    regenerated = maker.regenerateConfigs()
+    refresh_character_manager_tree()
+
+    timed_info_label(
+        sidebar_frame,
+        info_label,
+        f"{len(regenerated)} character config(s) regenerated.",
+        "success",
+    )
+
+
+def refresh_stale_configs_handler(sidebar_frame: ttk.Frame, info_label: ttk.Label):
+    refreshed = maker.refreshStaleConfigs()
+    refresh_character_manager_tree()
+
+    timed_info_label(
+        sidebar_frame,
+        info_label,
+        f"{len(refreshed)} stale character config(s) refreshed.",
+        "success",
+    )
+
+
 def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     import_manager_frame = ttk.Frame(notebook)
     import_manager_frame.grid(column=0, row=0, sticky=(N, S, E, W))
@@ -249,7 +330,7 @@ def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
         text="",
         font=("TkDefaultFont", 16),
     )
-    info_label.grid(column=0, row=3, columnspan=4, sticky=(N, S, E, W))
+    info_label.grid(column=0, row=5, columnspan=4, sticky=(N, S, E, W))
 
     # main
     tree = ttk.Treeview(
@@ -286,7 +367,13 @@ def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     )
     tree.configure(yscrollcommand=tree_s.set, selectmode="browse", height=15)
     tree_s.grid(column=1, row=0, sticky=(N, S))
-    tree.bind("<<TreeviewSelect>>", lambda e: refresh_new_config(new_config, tree))
+    tree.bind(
+        "<<TreeviewSelect>>",
+        lambda e: (
+            refresh_new_config(new_config, tree),
+            refresh_diff(old_config, new_config, diff_output),
+        ),
+    )
 
     pane = ttk.PanedWindow(main_import_manager_frame)
     style = ttk.Style()
@@ -295,6 +382,7 @@ def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
 
     old_config_frame = ttk.Label(pane)
     new_config_frame = ttk.Label(pane)
+    diff_frame = ttk.Label(pane)
 
     ttk.Label(old_config_frame, text="Old Config").grid(column=0, row=0)
     old_config = ScrolledText(old_config_frame, height=10)
@@ -308,15 +396,26 @@ def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     new_config.grid(column=0, row=1, sticky=(S, E, W))
     new_config_frame.grid_columnconfigure(0, weight=1)
 
+    ttk.Label(diff_frame, text="Changes").grid(column=0, row=0)
+    diff_output = ScrolledText(diff_frame, height=10)
+    diff_output.configure(state="disabled")
+    diff_output.grid(column=0, row=1, sticky=(S, E, W))
+    diff_frame.grid_columnconfigure(0, weight=1)
+
     pane.add(old_config_frame)
     pane.add(new_config_frame)
+    pane.add(diff_frame)
     pane.grid(row=1, columnspan=2, sticky=(S, E, W))
 
     # buttons
 
     cb_entry = StringVar()
     cb_entry.trace_add(
-        "write", lambda a, b, c: refresh_old_config(cb_entry, c, old_config)
+        "write",
+        lambda a, b, c: (
+            refresh_old_config(cb_entry, c, old_config),
+            refresh_diff(old_config, new_config, diff_output),
+        ),
     )
 
     cb = ttk.Combobox(
@@ -356,8 +455,27 @@ def setup_import_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
         ),
     ).grid(column=2, row=0, columnspan=2, sticky=(E, W))
 
+    ttk.Button(
+        sidebar_frame,
+        text="Regenerate All Saved Configs",
+        command=lambda: regenerate_configs_handler(sidebar_frame, info_label),
+    ).grid(column=0, row=2, columnspan=2, sticky=(E, W))
+    ttk.Button(
+        sidebar_frame,
+        text="Refresh Stale Configs",
+        command=lambda: refresh_stale_configs_handler(sidebar_frame, info_label),
+    ).grid(column=2, row=2, columnspan=2, sticky=(E, W))
+
+    ttk.Button(
+        sidebar_frame,
+        text="Check Saved Configs Against Import",
+        command=lambda: check_saved_configs_handler(
+            diff_output, sidebar_frame, info_label
+        ),
+    ).grid(column=0, row=3, columnspan=4, sticky=(E, W))
+
     ttk.Separator(sidebar_frame, orient=HORIZONTAL).grid(
-        column=0, row=2, columnspan=4, sticky=(E, W), pady=5
+        column=0, row=4, columnspan=4, sticky=(E, W), pady=5
     )
 
     return import_manager_frame
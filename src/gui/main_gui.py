@@ -5,7 +5,7 @@ from .character_manager import setup_character_manager_frame
 from .config_manager import setup_config_manager_frame
 from .import_manager import setup_import_manager_frame
 from .rotation_manager import setup_rotation_manager_frame
-from .sim_manager import setup_sim_manager_frame
+from .sim_manager import close_handler, setup_sim_manager_frame
 
 
 # setup
@@ -31,4 +31,6 @@ def main():
     notebook.add(config_manager_frame, text="Configs")
     notebook.add(sim_manager_frame, text="Sim")
 
+    root.protocol("WM_DELETE_WINDOW", lambda: close_handler(root))
+
     root.mainloop()
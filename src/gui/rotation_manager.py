@@ -1,11 +1,13 @@
-import sqlite3
 from tkinter import *
 from tkinter import messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 
+import db
+import maker
+
 
 def get_rotation_config_list() -> list[str]:
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -29,7 +31,7 @@ def load_rotation_config(
 ):
     if not listbox.get():
         return
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -64,7 +66,7 @@ def delete_rotation_config(
     if not listbox.get():
         return
 
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
         cursor.execute(
             """ 
@@ -96,7 +98,7 @@ def save_rotation_config(
     if not save_name.get():
         return
 
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         cursor.execute(
@@ -115,13 +117,7 @@ def save_rotation_config(
             if not res:
                 return
 
-        cursor.execute(
-            """ 
-            INSERT OR REPLACE INTO Rotation_Configs (config_name, config)
-            VALUES (?, ?)
-            """,
-            (save_name.get(), display_config.get("1.0", "end")),
-        )
+        maker.saveRotationConfig(save_name.get(), display_config.get("1.0", "end"))
 
     # change wordwrap before displaying text
     info_label.configure(wraplength=sidebar_frame.winfo_width() - 20)
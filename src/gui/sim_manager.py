@@ -1,17 +1,21 @@
 import os
-import sqlite3
-import subprocess
-import sys
-import tempfile
+import queue
+import threading
 from tkinter import *
 from tkinter import filedialog, ttk
 from tkinter.scrolledtext import ScrolledText
 from typing import Literal
 
+import db
+import jobs
+import maker
+import runner
+
 from .config_manager import get_full_config_list
 
 id = None
 results = {}
+batch_thread = None
 
 
 def timed_info_label(
@@ -56,6 +60,7 @@ def add_sim_config(
         return
 
     config_list.insert("", "end", iid=selected_config, text=selected_config)
+    jobs.save_queue(list(config_list.get_children("")))
 
 
 def remove_sim_config(config_list: ttk.Treeview):
@@ -63,6 +68,7 @@ def remove_sim_config(config_list: ttk.Treeview):
         return
     results.pop(config_list.selection()[0], None)
     config_list.delete(config_list.selection()[0])
+    jobs.save_queue(list(config_list.get_children("")))
 
 
 def exe_selector(sidebar_frame: ttk.Frame, info_label: ttk.Label, entry: ttk.Entry):
@@ -115,47 +121,12 @@ def refresh_textbox(
     display_config.configure(state="normal")
     display_config.delete("1.0", "end")
 
-    with sqlite3.connect("configs.db") as con:
-        cursor = con.cursor()
-
-        cursor.execute(
-            f""" 
-            SELECT character1, character2, character3, character4, rotation
-            FROM Full_Configs
-            WHERE config_name = ?
-            """,
-            (selected_config,),
-        )
-        row = cursor.fetchone()
-        if not row:
-            display_config.insert("1.0", "Config not found.")
-            display_config.configure(state="disabled")
-            return
-        characters = [x for x in row[:4] if x]
-        rotation = row[4]
-        full_config = ""
-
-        cursor.execute(
-            f""" 
-            SELECT config
-            FROM Character_Configs
-            WHERE config_name IN({','.join(['?'] * len(characters))})
-            """,
-            tuple(characters),
-        )
-        full_config += "\n".join([x for (x,) in cursor.fetchall()])
-
-        cursor.execute(
-            f""" 
-            SELECT config
-            FROM Rotation_Configs
-            WHERE config_name = ?
-            """,
-            (rotation,),
-        )
-        row = cursor.fetchone()
-        if row:
-            full_config += "\n" + row[0]
+    try:
+        full_config = maker.makeFullConfig(selected_config, require_rotation=False)
+    except KeyError:
+        display_config.insert("1.0", "Config not found.")
+        display_config.configure(state="disabled")
+        return
 
     display_config.insert("1.0", full_config)
     display_config.configure(state="disabled")
@@ -172,14 +143,15 @@ def launch_handler(
     single: bool = False,
     browser: bool = False,
     options: str = "",
+    workers: int | None = None,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    remote: list[str] | None = None,
 ):
     global results
 
-    maindir = os.path.abspath(
-        os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
-    )
-
-    if not os.path.isfile(exe_path):
+    # browser runs always need the local gcsim, see runner.run_batch
+    if (browser or not remote) and not os.path.isfile(exe_path):
         timed_info_label(
             sidebar_frame,
             info_label,
@@ -189,7 +161,14 @@ def launch_handler(
         )
         return
 
-    os.makedirs(os.path.join(maindir, "out"), exist_ok=True)
+    if batch_thread:
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            "A simulation batch is already running.",
+            "warning",
+        )
+        return
 
     if single and not config_list.selection():
         timed_info_label(
@@ -203,120 +182,343 @@ def launch_handler(
     if not single:
         results = {}
 
-    with sqlite3.connect("configs.db") as con:
-        cursor = con.cursor()
-
-        for item in config_list.get_children(""):
-            if single:
-                if item != config_list.selection()[0]:
-                    continue
-                results.pop(item, None)
-
-            selected_config = item
-            cursor.execute(
-                f""" 
-                SELECT character1, character2, character3, character4, rotation
-                FROM Full_Configs
-                WHERE config_name = ?
-                """,
-                (selected_config,),
+    if single:
+        names = [config_list.selection()[0]]
+        results.pop(names[0], None)
+    else:
+        names = list(config_list.get_children(""))
+
+    try:
+        configs = maker.makeFullConfigs(names)
+    except KeyError as e:
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            e.args[0],
+            "warning",
+        )
+        return
+
+    batch = jobs.create_batch(configs, options, browser)
+    start_jobs(
+        jobs.get_jobs("WHERE batch = ?", (batch,)),
+        exe_path,
+        config_list,
+        log_output,
+        sidebar_frame,
+        info_label,
+        workers,
+        use_cache,
+        timeout,
+        None if browser else remote,
+    )
+
+
+def resume_handler(
+    config_list: ttk.Treeview,
+    log_output: ScrolledText,
+    exe_path: str,
+    sidebar_frame: ttk.Frame,
+    info_label: ttk.Label,
+    workers: int | None = None,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    remote: list[str] | None = None,
+):
+    if not remote and not os.path.isfile(exe_path):
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            "GCSim executable not found. Please select a valid path.",
+            "warning",
+            None,
+        )
+        return
+
+    if batch_thread:
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            "A simulation batch is already running.",
+            "warning",
+        )
+        return
+
+    job_list = jobs.unfinished()
+    if not job_list:
+        timed_info_label(
+            sidebar_frame, info_label, "No unfinished simulations to resume.", "info"
+        )
+        return
+
+    for job in job_list:
+        if not config_list.exists(job["config_name"]):
+            config_list.insert(
+                "", "end", iid=job["config_name"], text=job["config_name"]
+            )
+    jobs.save_queue(list(config_list.get_children("")))
+
+    start_jobs(
+        job_list,
+        exe_path,
+        config_list,
+        log_output,
+        sidebar_frame,
+        info_label,
+        workers,
+        use_cache,
+        timeout,
+        remote,
+    )
+
+
+def start_jobs(
+    job_list: list[dict],
+    exe_path: str,
+    config_list: ttk.Treeview,
+    log_output: ScrolledText,
+    sidebar_frame: ttk.Frame,
+    info_label: ttk.Label,
+    workers: int | None = None,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    remote: list[str] | None = None,
+):
+    global batch_thread
+
+    maindir = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
+    )
+    out_dir = os.path.join(maindir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    names = [job["config_name"] for job in job_list]
+
+    for name in names:
+        results[name] = {"returncode": None, "output": ""}
+    refresh_output_log(
+        config_list.selection()[0] if config_list.selection() else None, log_output
+    )
+
+    # with remote workers the number of parallel sims is their total slots,
+    # browser runs go one at a time (see runner.run_batch)
+    if job_list and job_list[0]["browser"]:
+        workers = 1
+        where = "one at a time"
+    elif remote:
+        workers = None
+        where = f"on {len(remote)} remote worker(s)"
+    else:
+        where = f"on up to {workers or runner.default_workers()} worker(s)"
+    timed_info_label(
+        sidebar_frame,
+        info_label,
+        f"Running {len(names)} simulation(s) {where}...",
+        "success",
+        delay=None,
+    )
+
+    # gcsim runs on a background thread; everything touching tk goes through
+    # the event queue, which poll_batch_events drains from the mainloop
+    events = queue.Queue()
+
+    def run():
+        error = None
+        try:
+            jobs.run_jobs(
+                exe_path,
+                job_list,
+                out_dir,
+                workers=workers,
+                use_cache=use_cache,
+                on_result=lambda name, result: events.put(("result", name, result)),
+                on_line=lambda name, line: events.put(("line", name, line)),
+                timeout=timeout,
+                remote=remote,
             )
-            row = cursor.fetchone()
-            if not row:
+        except ConnectionError as e:
+            error = str(e)
+        finally:
+            db.close_connection()
+            events.put(("done", None, error))
+
+    batch_thread = threading.Thread(target=run, daemon=True)
+    batch_thread.start()
+
+    poll_batch_events(events, names, config_list, log_output, sidebar_frame, info_label)
+
+
+def cancel_current_handler(
+    config_list: ttk.Treeview, sidebar_frame: ttk.Frame, info_label: ttk.Label
+):
+    if not batch_thread or not config_list.selection():
+        timed_info_label(
+            sidebar_frame, info_label, "No running simulation selected.", "warning"
+        )
+        return
+
+    name = config_list.selection()[0]
+    if name not in results or results[name]["returncode"] is not None:
+        timed_info_label(
+            sidebar_frame, info_label, f"{name} is not running.", "warning"
+        )
+        return
+
+    if runner.cancel(name):
+        timed_info_label(sidebar_frame, info_label, f"Cancelling {name}...", "info")
+    else:
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            f"{name} will be cancelled when it starts.",
+            "info",
+        )
+
+
+def cancel_batch_handler(sidebar_frame: ttk.Frame, info_label: ttk.Label):
+    if not batch_thread:
+        timed_info_label(
+            sidebar_frame, info_label, "No simulation batch is running.", "warning"
+        )
+        return
+
+    runner.cancel_batch()
+    timed_info_label(sidebar_frame, info_label, "Cancelling the batch...", "info")
+
+
+def close_handler(root: Tk):
+    # the gcsim processes would outlive the window, and the batch thread has
+    # to record the cancelled jobs before the interpreter exits
+    if batch_thread:
+        runner.cancel_batch()
+        batch_thread.join()
+    root.destroy()
+
+
+def restore_queue(config_list: ttk.Treeview):
+    # the queue and the output of the last batch, as they were at exit
+    for name in jobs.load_queue():
+        if not config_list.exists(name):
+            config_list.insert("", "end", iid=name, text=name)
+    for job in jobs.latest_batch():
+        results[job["config_name"]] = {
+            "returncode": job["returncode"],
+            "output": job["output"] or "",
+            "cached": bool(job["cached"]),
+        }
+
+
+def export_handler(
+    config_list: ttk.Treeview, sidebar_frame: ttk.Frame, info_label: ttk.Label
+):
+    names = list(config_list.get_children(""))
+    if not names:
+        timed_info_label(sidebar_frame, info_label, "No configs to export.", "warning")
+        return
+
+    out_dir = filedialog.askdirectory(title="Export configs to")
+    if not out_dir:
+        return
+
+    try:
+        manifest = maker.exportFullConfigs(out_dir, names)
+    except (KeyError, OSError) as e:
+        timed_info_label(
+            sidebar_frame,
+            info_label,
+            e.args[0] if isinstance(e, KeyError) else f"Export failed: {e}",
+            "warning",
+        )
+        return
+
+    timed_info_label(
+        sidebar_frame,
+        info_label,
+        f"{len(manifest)} config(s) exported to {out_dir}.",
+        "success",
+    )
+
+
+def poll_batch_events(
+    events: queue.Queue,
+    names: list[str],
+    config_list: ttk.Treeview,
+    log_output: ScrolledText,
+    sidebar_frame: ttk.Frame,
+    info_label: ttk.Label,
+):
+    global batch_thread
+
+    while True:
+        try:
+            event, name, payload = events.get_nowait()
+        except queue.Empty:
+            break
+
+        if event == "line":
+            result = results.setdefault(name, {"returncode": None, "output": ""})
+            result["output"] += payload
+            if config_list.selection() and config_list.selection()[0] == name:
+                log_output.configure(state="normal")
+                log_output.insert("end", payload)
+                log_output.see("end")
+                log_output.configure(state="disabled")
+        elif event == "result":
+            results[name] = payload
+        else:
+            batch_thread = None
+            skipped = [x for x in names if results.get(x, {}).get("skipped")]
+            if payload:
                 timed_info_label(
                     sidebar_frame,
                     info_label,
-                    f"Config {selected_config} not found.",
+                    f"{payload} The batch can be resumed.",
                     "warning",
+                    None,
                 )
                 return
-            characters = [x for x in row[:4] if x]
-            rotation = row[4]
-            full_config = ""
-
-            cursor.execute(
-                f""" 
-                SELECT config
-                FROM Character_Configs
-                WHERE config_name IN({','.join(['?'] * len(characters))})
-                """,
-                tuple(characters),
-            )
-            full_config += "\n".join([x for (x,) in cursor.fetchall()])
-
-            cursor.execute(
-                f""" 
-                SELECT config
-                FROM Rotation_Configs
-                WHERE config_name = ?
-                """,
-                (rotation,),
-            )
-            row = cursor.fetchone()
-            if not row:
+            failed = [
+                x
+                for x in names
+                if x in results and results[x]["returncode"] != 0 and x not in skipped
+            ]
+            if failed:
                 timed_info_label(
                     sidebar_frame,
                     info_label,
-                    f"Config rotation not found.",
+                    f"Simulation failed for {', '.join(failed)}."
+                    + (f" {len(skipped)} not started." if skipped else ""),
                     "warning",
                 )
-                return
-            full_config += "\n" + row[0]
-
-            with tempfile.NamedTemporaryFile(
-                mode="w", suffix=".txt", encoding="utf-8", delete_on_close=False
-            ) as temp_config_file:
-                temp_config_file.write(full_config)
-                temp_config_file.close()
-
-                arglist = [
-                    exe_path,
-                    "-c",
-                    temp_config_file.name,
-                    "-out",
-                    os.path.join(maindir, "out", f"{selected_config}.json"),
-                ]
-                if browser:
-                    arglist.append("-s")
-                if options:
-                    arglist.extend(options.split(" "))
-
+            elif skipped:
                 timed_info_label(
                     sidebar_frame,
                     info_label,
-                    f"Running simulation for {selected_config}...",
-                    "success",
-                    delay=None,
-                )
-                sim = subprocess.run(
-                    args=arglist, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+                    f"Batch cancelled, {len(skipped)} simulation(s) not started.",
+                    "warning",
                 )
-
+            else:
+                cached = len([x for x in names if results.get(x, {}).get("cached")])
                 timed_info_label(
                     sidebar_frame,
                     info_label,
-                    f"",
+                    (
+                        f"{cached} of {len(names)} result(s) loaded from cache."
+                        if cached
+                        else ""
+                    ),
                     "info",
                 )
-                results[selected_config] = {
-                    "returncode": sim.returncode,
-                    "output": sim.stdout.decode("utf-8"),
-                }
-                if config_list.selection():
-                    refresh_output_log(config_list.selection()[0], log_output)
-                else:
-                    refresh_output_log(None, log_output)
-
-                if sim.stderr and sim.returncode != 0:
-                    timed_info_label(
-                        sidebar_frame,
-                        info_label,
-                        sim.stderr.decode("utf-8"),
-                        "info",
-                    )
 
-    if not config_list.selection():
-        config_list.selection_set(config_list.get_children("")[-1])
+            if not config_list.selection() and config_list.get_children(""):
+                config_list.selection_set(config_list.get_children("")[-1])
+            return
+
+    log_output.after(
+        50,
+        lambda: poll_batch_events(
+            events, names, config_list, log_output, sidebar_frame, info_label
+        ),
+    )
 
 
 def set_default_substat_options(
@@ -407,6 +609,8 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     log_output.configure(state="disabled")
     log_output.grid(column=0, row=1, sticky=(S, E, W), padx=10, pady=(0, 10))
 
+    restore_queue(config_list)
+
     config_list.bind(
         "<<TreeviewSelect>>",
         lambda e: config_list.selection()
@@ -506,6 +710,60 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     fixed_substats_box = ttk.Spinbox(right_sidebar_frame, from_=0, to=100, width=5)
     fixed_substats_box.grid(column=1, row=8, columnspan=3, sticky=(E, W))
 
+    ttk.Label(right_sidebar_frame, text="Parallel Sims", anchor="center").grid(
+        column=0, row=9, sticky=(W, E)
+    )
+    workers_box = ttk.Spinbox(
+        right_sidebar_frame, from_=1, to=runner.default_workers(), width=5
+    )
+    workers_box.grid(column=1, row=9, columnspan=3, sticky=(E, W))
+    workers_box.set(runner.default_workers())
+
+    ttk.Label(right_sidebar_frame, text="Timeout (s)", anchor="center").grid(
+        column=0, row=10, sticky=(W, E)
+    )
+    timeout_box = ttk.Spinbox(right_sidebar_frame, from_=0, to=86400, width=5)
+    timeout_box.grid(column=1, row=10, columnspan=3, sticky=(E, W))
+    timeout_box.set(0)
+
+    ttk.Label(right_sidebar_frame, text="Remote Workers", anchor="center").grid(
+        column=0, row=11, sticky=(W, E)
+    )
+    remote_box = ttk.Entry(right_sidebar_frame, width=30)
+    remote_box.grid(column=1, row=11, columnspan=3, sticky=(E, W))
+
+    use_cache = BooleanVar(value=True)
+    ttk.Checkbutton(
+        right_sidebar_frame,
+        text="Use Cached Results",
+        variable=use_cache,
+    ).grid(column=0, row=12, columnspan=2, sticky=(E, W))
+    ttk.Button(
+        right_sidebar_frame,
+        text="Clear Cache",
+        command=lambda: runner.clear_cache()
+        or timed_info_label(
+            right_sidebar_frame, info_label, "Result cache cleared.", "success"
+        ),
+    ).grid(column=2, row=12, columnspan=2, sticky=(E, W))
+
+    def get_workers() -> int | None:
+        try:
+            return max(1, int(workers_box.get()))
+        except ValueError:
+            return None
+
+    def get_remote() -> list[str]:
+        # host:port of worker daemons, comma separated. empty runs locally
+        return runner.parse_addresses(remote_box.get())
+
+    def get_timeout() -> float | None:
+        # 0 or anything unreadable means no limit
+        try:
+            return float(timeout_box.get()) or None
+        except ValueError:
+            return None
+
     substat_optimizer_button.configure(
         command=lambda: (
             disable_substat_optimizer_options(
@@ -535,23 +793,13 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
     substat_optimizer_button.invoke()
 
     def generate_options_string() -> str:
-        if not substat_optimizer.get():
-            return ""
-        options = '-substatOptimFull -options="'
-        # fine_tune={1 if fine_tune else 0};'
-        if (
-            liquid_substats_box.get()
-            or liquid_cap_box.get()
-            or fixed_substats_box.get()
-        ):
-            if liquid_substats_box.get():
-                options += f"total_liquid_substats={liquid_substats_box.get()};"
-            if liquid_cap_box.get():
-                options += f"indiv_liquid_cap={liquid_cap_box.get()};"
-            if fixed_substats_box.get():
-                options += f"fixed_substats_count={fixed_substats_box.get()};"
-        options += f'fine_tune={1 if fine_tune.get() else 0};"'
-        return options
+        return runner.make_options_string(
+            substat_optimizer.get(),
+            fine_tune.get(),
+            liquid_substats_box.get(),
+            liquid_cap_box.get(),
+            fixed_substats_box.get(),
+        )
 
     ttk.Button(
         right_sidebar_frame,
@@ -564,8 +812,11 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
             info_label,
             browser=True,
             options=generate_options_string(),
+            workers=get_workers(),
+            use_cache=use_cache.get(),
+            timeout=get_timeout(),
         ),
-    ).grid(column=0, row=9, columnspan=2, sticky=(E, W))
+    ).grid(column=0, row=13, columnspan=2, sticky=(E, W))
     ttk.Button(
         right_sidebar_frame,
         text="Run all in CLI",
@@ -576,8 +827,12 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
             right_sidebar_frame,
             info_label,
             options=generate_options_string(),
+            workers=get_workers(),
+            use_cache=use_cache.get(),
+            timeout=get_timeout(),
+            remote=get_remote(),
         ),
-    ).grid(column=2, row=9, columnspan=2, sticky=(E, W))
+    ).grid(column=2, row=13, columnspan=2, sticky=(E, W))
 
     ttk.Button(
         right_sidebar_frame,
@@ -591,8 +846,9 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
             single=True,
             browser=True,
             options=generate_options_string(),
+            timeout=get_timeout(),
         ),
-    ).grid(column=0, row=10, columnspan=2, sticky=(E, W))
+    ).grid(column=0, row=14, columnspan=2, sticky=(E, W))
     ttk.Button(
         right_sidebar_frame,
         text="Run config in CLI",
@@ -604,13 +860,50 @@ def setup_sim_manager_frame(root: Tk, notebook: ttk.Notebook) -> ttk.Frame:
             info_label,
             single=True,
             options=generate_options_string(),
+            use_cache=use_cache.get(),
+            timeout=get_timeout(),
+            remote=get_remote(),
         ),
-    ).grid(column=2, row=10, columnspan=2, sticky=(E, W))
+    ).grid(column=2, row=14, columnspan=2, sticky=(E, W))
+
+    ttk.Button(
+        right_sidebar_frame,
+        text="Export queued configs",
+        command=lambda: export_handler(config_list, right_sidebar_frame, info_label),
+    ).grid(column=0, row=15, columnspan=2, sticky=(E, W))
+    ttk.Button(
+        right_sidebar_frame,
+        text="Resume unfinished",
+        command=lambda: resume_handler(
+            config_list,
+            log_output,
+            exepath.get(),
+            right_sidebar_frame,
+            info_label,
+            workers=get_workers(),
+            use_cache=use_cache.get(),
+            timeout=get_timeout(),
+            remote=get_remote(),
+        ),
+    ).grid(column=2, row=15, columnspan=2, sticky=(E, W))
+
+    ttk.Button(
+        right_sidebar_frame,
+        text="Cancel current",
+        command=lambda: cancel_current_handler(
+            config_list, right_sidebar_frame, info_label
+        ),
+    ).grid(column=0, row=16, columnspan=2, sticky=(E, W))
+    ttk.Button(
+        right_sidebar_frame,
+        text="Cancel batch",
+        command=lambda: cancel_batch_handler(right_sidebar_frame, info_label),
+    ).grid(column=2, row=16, columnspan=2, sticky=(E, W))
 
     ttk.Separator(right_sidebar_frame, orient=HORIZONTAL).grid(
-        column=0, row=11, columnspan=4, sticky=(E, W), pady=5
+        column=0, row=17, columnspan=4, sticky=(E, W), pady=5
     )
 
-    info_label.grid(column=0, row=12, columnspan=4, sticky=(E, W))
+    info_label.grid(column=0, row=18, columnspan=4, sticky=(E, W))
 
     return sim_manager_frame
@@ -0,0 +1,166 @@
+# simulation batches as rows in Sim_Jobs, so a batch survives the app closing
+# or gcsim crashing and its unfinished jobs can be run again. the Sim tab
+# queue itself is kept in Sim_Queue
+import os
+from typing import Any, Callable
+
+import db
+import results
+import runner
+import util
+
+# a job is pending until its gcsim process starts, running until it exits.
+# running jobs found after a restart were interrupted and count as unfinished
+STATES = ("pending", "running", "done", "failed")
+
+
+def create_batch(
+    configs: dict[str, str], options: str = "", browser: bool = False
+) -> int:
+    # one pending job per assembled config, returns the batch id
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        (batch,) = cursor.execute(
+            "SELECT COALESCE(MAX(batch), 0) + 1 FROM Sim_Jobs"
+        ).fetchone()
+        cursor.executemany(
+            """
+            INSERT INTO Sim_Jobs (batch, position, config_name, config_hash, config, options, browser)
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            [
+                (
+                    batch,
+                    position,
+                    name,
+                    results.config_hash(config),
+                    config,
+                    options,
+                    int(browser),
+                )
+                for position, (name, config) in enumerate(configs.items())
+            ],
+        )
+    return batch
+
+
+def get_jobs(where: str = "", params: tuple = ()) -> list[dict[str, Any]]:
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.row_factory = util.dict_factory
+        return cursor.execute(
+            f"""
+            SELECT id, batch, position, config_name, config_hash, config, options, browser, state, returncode, output, cached
+            FROM Sim_Jobs
+            {where}
+            ORDER BY batch, position
+            """,
+            params,
+        ).fetchall()
+
+
+def latest_batch() -> list[dict[str, Any]]:
+    return get_jobs("WHERE batch = (SELECT MAX(batch) FROM Sim_Jobs)")
+
+
+def unfinished() -> list[dict[str, Any]]:
+    # the pending and interrupted jobs of the newest batch that has any
+    return get_jobs(
+        """
+        WHERE state IN ('pending', 'running') AND batch = (
+            SELECT MAX(batch) FROM Sim_Jobs WHERE state IN ('pending', 'running')
+        )
+        """
+    )
+
+
+def mark_running(job_id: int):
+    with db.get_connection() as con:
+        con.execute(
+            "UPDATE Sim_Jobs SET state = 'running', updated = CURRENT_TIMESTAMP WHERE id = ?",
+            (job_id,),
+        )
+
+
+def mark_finished(job_id: int, result: dict[str, Any]):
+    with db.get_connection() as con:
+        con.execute(
+            """
+            UPDATE Sim_Jobs
+            SET state = ?, returncode = ?, output = ?, cached = ?, updated = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (
+                "done" if result["returncode"] == 0 else "failed",
+                result["returncode"],
+                result["output"],
+                int(bool(result.get("cached"))),
+                job_id,
+            ),
+        )
+
+
+def run_jobs(
+    exe_path: str,
+    jobs: list[dict[str, Any]],
+    out_dir: str,
+    workers: int | None = None,
+    use_cache: bool = True,
+    on_result: Callable[[str, dict[str, Any]], None] | None = None,
+    on_line: Callable[[str, str], None] | None = None,
+    timeout: float | None = None,
+    remote: list[str] | None = None,
+) -> dict[str, dict[str, Any]]:
+    # runs jobs from one batch through runner.run_batch, recording their state
+    # as they go and storing the results of the ones that succeed. skipped
+    # jobs, by runner.cancel_batch or for lack of a worker, stay pending
+    if not jobs:
+        return {}
+    ids = {job["config_name"]: job["id"] for job in jobs}
+    configs = {job["config_name"]: job["config"] for job in jobs}
+    options = jobs[0]["options"]
+
+    def finished(name: str, result: dict[str, Any]):
+        if not result.get("skipped"):
+            mark_finished(ids[name], result)
+        if result["returncode"] == 0:
+            results.store_result(
+                name, configs[name], os.path.join(out_dir, f"{name}.json"), options
+            )
+        if on_result:
+            on_result(name, result)
+
+    return runner.run_batch(
+        exe_path,
+        configs,
+        out_dir,
+        browser=bool(jobs[0]["browser"]),
+        options=options,
+        workers=workers,
+        use_cache=use_cache,
+        on_start=lambda name: mark_running(ids[name]),
+        on_result=finished,
+        on_line=on_line,
+        timeout=timeout,
+        remote=remote,
+    )
+
+
+def save_queue(names: list[str]):
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute("DELETE FROM Sim_Queue")
+        cursor.executemany(
+            "INSERT INTO Sim_Queue (position, config_name) VALUES (?, ?)",
+            list(enumerate(names)),
+        )
+
+
+def load_queue() -> list[str]:
+    with db.get_connection() as con:
+        return [
+            name
+            for (name,) in con.execute(
+                "SELECT config_name FROM Sim_Queue ORDER BY position"
+            )
+        ]
@@ -1,12 +1,21 @@
 # reads characters from GOOD database into sqlite
 
+import hashlib
 import json
 import sqlite3
 
+import db
+
 characters = {}
 
+# GOOD character ids touched by the last export, for anything caching per character
+dirty_characters = set()
+
+SLOTS = ["flower", "plume", "sands", "goblet", "circlet"]
+
 
 def load(db: object):
+    characters.clear()
 
     for char in db["characters"]:
         if char["key"].startswith("Traveler"):
@@ -23,54 +32,290 @@ def load(db: object):
             characters[artifact["location"]][artifact["slotKey"]] = artifact
 
 
-def create_table():
-    with sqlite3.connect("configs.db") as con:
-        cursor = con.cursor()
+def create_import_tables(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Characters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                ascension INTEGER NOT NULL,
+                talent TEXT NOT NULL,
+                constellation INTEGER NOT NULL,
+                weapon INTEGER NOT NULL REFERENCES Weapons(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                flower INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                plume INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                sands INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                goblet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                circlet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+                fingerprint TEXT
+            );
+        """
+    )
 
-        cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS Characters (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    level INTEGER NOT NULL,
-                    ascension INTEGER NOT NULL,
-                    talent TEXT NOT NULL,
-                    constellation INTEGER NOT NULL,
-                    weapon INTEGER NOT NULL REFERENCES Weapons(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
-                    flower INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
-                    plume INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
-                    sands INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
-                    goblet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
-                    circlet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT
-                );
-            """
-        )
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Weapons (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                refinement INTEGER NOT NULL,
+                level INTEGER NOT NULL,
+                ascension INTEGER NOT NULL,
+                fingerprint TEXT
+            );
+        """
+    )
+
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Artifacts(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                setKey TEXT NOT NULL,
+                rarity INTEGER NOT NULL,
+                level INTEGER NOT NULL,
+                slotKey TEXT NOT NULL,
+                mainStat TEXT NOT NULL,
+                fingerprint TEXT
+            );
+        """
+    )
+
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Artifact_Substats(
+                artifact INTEGER NOT NULL REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (artifact, position)
+            );
+        """
+    )
+
+    # the import tables are dropped on a full import, so their indexes are
+    # created alongside them rather than in a migration
+    cursor.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Characters_name ON Characters(name);
+        """
+    )
+    cursor.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Artifact_Substats_key ON Artifact_Substats(key, value);
+        """
+    )
+
+
+def add_fingerprint_columns(cursor: sqlite3.Cursor):
+    for table in ["Characters", "Weapons", "Artifacts"]:
+        columns = [x[1] for x in cursor.execute(f"PRAGMA table_info({table})")]
+        if "fingerprint" not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN fingerprint TEXT")
 
-        cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS Weapons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    refinement INTEGER NOT NULL,
-                    level INTEGER NOT NULL,
-                    ascension INTEGER NOT NULL
-                );
-            """
-        )
 
+def add_config_indexes(cursor: sqlite3.Cursor):
+    for column in ["character1", "character2", "character3", "character4", "rotation"]:
         cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS Artifacts(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    setKey TEXT NOT NULL,
-                    rarity INTEGER NOT NULL,
-                    level INTEGER NOT NULL,
-                    slotKey TEXT NOT NULL,
-                    mainStat TEXT NOT NULL,
-                    substats TEXT NOT NULL
-                );
-            """
+            f"CREATE INDEX IF NOT EXISTS Full_Configs_{column} ON Full_Configs({column})"
         )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Character_Configs_character ON Character_Configs(character)"
+    )
+
+
+def normalize_substats(cursor: sqlite3.Cursor):
+    # substats used to be a json blob on each artifact row
+    columns = [x[1] for x in cursor.execute("PRAGMA table_info(Artifacts)")]
+    if "substats" not in columns:
+        return
+
+    rows = []
+    for artifact, substats in cursor.execute("SELECT id, substats FROM Artifacts"):
+        rows.extend(substat_rows(artifact, json.loads(substats)["substats"]))
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO Artifact_Substats (artifact, position, key, value)
+        VALUES (?,?,?,?)
+        """,
+        rows,
+    )
+    cursor.execute("ALTER TABLE Artifacts DROP COLUMN substats")
+
+
+def add_config_generation(cursor: sqlite3.Cursor):
+    # a counter bumped on every change to the saved configs, so assembled team
+    # configs can be cached until something they are built from changes
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Config_Generation (
+                generation INTEGER NOT NULL
+            );
+        """
+    )
+    cursor.execute("INSERT INTO Config_Generation (generation) VALUES (0)")
+    for table in ["Character_Configs", "Rotation_Configs", "Full_Configs"]:
+        for event in ["INSERT", "UPDATE", "DELETE"]:
+            cursor.execute(
+                f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_generation
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE Config_Generation SET generation = generation + 1;
+                    END;
+                """
+            )
+
+
+def add_gear_fingerprints(cursor: sqlite3.Cursor):
+    # the gear a saved character config was generated from, see
+    # maker.gearFingerprints. NULL for configs saved before this existed
+    columns = [x[1] for x in cursor.execute("PRAGMA table_info(Character_Configs)")]
+    if "gear_fingerprint" not in columns:
+        cursor.execute("ALTER TABLE Character_Configs ADD COLUMN gear_fingerprint TEXT")
+
+
+def add_sim_results(cursor: sqlite3.Cursor):
+    # summary statistics of finished gcsim runs, see results.py. one row per
+    # full config, config text hash and options, the latest run wins
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Sim_Results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                config_name TEXT NOT NULL,
+                config_hash TEXT NOT NULL,
+                options TEXT NOT NULL,
+                created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                sim_version TEXT,
+                iterations INTEGER,
+                duration REAL,
+                dps_mean REAL,
+                dps_min REAL,
+                dps_max REAL,
+                dps_std REAL,
+                UNIQUE (config_name, config_hash, options)
+            );
+        """
+    )
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Sim_Result_Characters (
+                result INTEGER NOT NULL REFERENCES Sim_Results(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                character TEXT NOT NULL,
+                dps_mean REAL,
+                dps_min REAL,
+                dps_max REAL,
+                dps_std REAL,
+                PRIMARY KEY (result, position)
+            );
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Sim_Results_dps ON Sim_Results(dps_mean)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Sim_Results_hash ON Sim_Results(config_hash)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Sim_Result_Characters_character ON Sim_Result_Characters(character, dps_mean)"
+    )
+
+
+def add_sim_jobs(cursor: sqlite3.Cursor):
+    # every simulation batch and the configs queued on the Sim tab, see jobs.py
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Sim_Jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                config_name TEXT NOT NULL,
+                config_hash TEXT NOT NULL,
+                config TEXT NOT NULL,
+                options TEXT NOT NULL,
+                browser INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'running', 'done', 'failed')),
+                returncode INTEGER,
+                output TEXT,
+                cached INTEGER,
+                created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Sim_Jobs_batch ON Sim_Jobs(batch, position)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS Sim_Jobs_state ON Sim_Jobs(state, batch)"
+    )
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Sim_Queue (
+                position INTEGER PRIMARY KEY,
+                config_name TEXT NOT NULL
+            );
+        """
+    )
+
+
+def add_sim_cache_files(cursor: sqlite3.Cursor):
+    # cached gcsim output and results are files in runner.cache_dir(), only
+    # their paths are kept here. the old rows held the files' contents, they
+    # are dropped and the cache fills again as configs are simmed
+    cursor.execute("DROP TABLE IF EXISTS Sim_Cache")
+    cursor.execute(
+        """
+            CREATE TABLE Sim_Cache (
+                cache_key TEXT PRIMARY KEY,
+                output_path TEXT NOT NULL,
+                result_path TEXT,
+                size INTEGER NOT NULL,
+                created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+    )
+
+
+# applied in order, each exactly once. append new steps to the end and never
+# reorder or remove old ones, existing databases record how far they got
+MIGRATIONS = [
+    add_fingerprint_columns,
+    add_config_indexes,
+    normalize_substats,
+    add_config_generation,
+    add_gear_fingerprints,
+    add_sim_results,
+    add_sim_jobs,
+    add_sim_cache_files,
+]
+
+
+def migrate(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Schema_Version (
+                version INTEGER PRIMARY KEY,
+                applied TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+    )
+    (current,) = cursor.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM Schema_Version"
+    ).fetchone()
+
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        migration(cursor)
+        cursor.execute("INSERT INTO Schema_Version (version) VALUES (?)", (version,))
+
+
+def create_table():
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute("BEGIN")
+        create_import_tables(cursor)
 
         cursor.execute(
             """
@@ -112,75 +357,233 @@ def create_table():
             """
         )
 
+        migrate(cursor)
         con.commit()
 
 
-def reset_temp_tables(con: sqlite3.Connection, cursor: sqlite3.Cursor):
-    for table in ["Characters", "Weapons", "Artifacts"]:
+def reset_temp_tables(cursor: sqlite3.Cursor):
+    for table in ["Characters", "Weapons", "Artifacts", "Artifact_Substats"]:
         cursor.execute(f"DROP TABLE IF EXISTS {table}")
-    con.commit()
-    create_table()
+    create_import_tables(cursor)
+
+
+def next_id(cursor: sqlite3.Cursor, table: str) -> int:
+    return cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+
+def fingerprint(*values) -> str:
+    return hashlib.sha1(
+        json.dumps(values, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def weapon_values(weap: dict) -> tuple:
+    values = (weap["key"], weap["refinement"], weap["level"], weap["ascension"])
+    return (*values, fingerprint(*values))
+
 
+def artifact_values(artifact: dict) -> tuple:
+    values = (
+        artifact["setKey"],
+        artifact["rarity"],
+        artifact["level"],
+        artifact["slotKey"],
+        artifact["mainStatKey"],
+    )
+    return (
+        *values,
+        fingerprint(*values, json.dumps({"substats": artifact["substats"]})),
+    )
 
-def export():
 
-    with sqlite3.connect("configs.db") as con:
+def substat_rows(artifact_id: int, substats: list[dict]) -> list[tuple]:
+    return [
+        (artifact_id, position, substat["key"], substat["value"])
+        for position, substat in enumerate(substats)
+        if substat["key"]
+    ]
+
+
+def character_values(character: dict) -> tuple:
+    values = (
+        character["level"],
+        character["ascension"],
+        f"{character['talent']['auto']},{character['talent']['skill']},{character['talent']['burst']}",
+        character["constellation"],
+    )
+    return (*values, fingerprint(*values))
+
+
+def has_fingerprints(cursor: sqlite3.Cursor) -> bool:
+    for table in ["Characters", "Weapons", "Artifacts"]:
+        columns = [x[1] for x in cursor.execute(f"PRAGMA table_info({table})")]
+        if "fingerprint" not in columns:
+            return False
+    return True
+
+
+def read_existing(cursor: sqlite3.Cursor) -> dict[str, dict]:
+    cursor.execute(
+        f"""
+        SELECT Characters.id, Characters.name, Characters.fingerprint, Characters.weapon,
+            Weapons.fingerprint AS weapon_fingerprint,
+            {", ".join(f"Characters.{x}, {x}.fingerprint AS {x}_fingerprint" for x in SLOTS)}
+        FROM Characters
+        JOIN Weapons ON Weapons.id = Characters.weapon
+        {" ".join(f"LEFT JOIN Artifacts AS {x} ON {x}.id = Characters.{x}" for x in SLOTS)}
+        """
+    )
+    fields = [column[0] for column in cursor.description]
+    return {row[1]: dict(zip(fields, row)) for row in cursor.fetchall()}
+
+
+def export(incremental: bool = False) -> dict[str, list[str]]:
+    # ids are assigned here rather than read back one row at a time, so each
+    # table is filled with a few executemany calls inside one transaction.
+    # in incremental mode, rows whose fingerprint is unchanged are left alone
+    with db.get_connection() as con:
         cursor = con.cursor()
-        reset_temp_tables(con, cursor)
+        cursor.execute("BEGIN")
+
+        if incremental and has_fingerprints(cursor):
+            existing = read_existing(cursor)
+        else:
+            reset_temp_tables(cursor)
+            existing = {}
+
+        weapon_id = next_id(cursor, "Weapons")
+        artifact_id = next_id(cursor, "Artifacts")
+        inserts = {"Weapons": [], "Artifacts": [], "Characters": []}
+        updates = {"Weapons": [], "Artifacts": [], "Characters": []}
+        deletes = {"Weapons": [], "Artifacts": [], "Characters": []}
+        substats = []
+        summary = {"added": [], "updated": [], "removed": [], "unchanged": []}
 
         for character in characters.values():
-            weap = character["weapon"]
-            ids = {}
-            ids["key"] = character["key"]
+            name = character["id"]
+            old = existing.pop(name, None)
+            weapon = weapon_values(character["weapon"])
+            changed = old is None
 
-            row = cursor.execute(
-                """
-                INSERT INTO weapons (name, refinement, level, ascension)
-                VALUES (?,?,?,?)
-                RETURNING id
-                """,
-                (weap["key"], weap["refinement"], weap["level"], weap["ascension"]),
-            )
-            ids["weapon"] = row.fetchone()[0]
+            if old is None:
+                ids = {"weapon": weapon_id}
+                inserts["Weapons"].append((weapon_id, *weapon))
+                weapon_id += 1
+            else:
+                ids = {"weapon": old["weapon"]}
+                if old["weapon_fingerprint"] != weapon[-1]:
+                    updates["Weapons"].append((*weapon, old["weapon"]))
+                    changed = True
 
-            for x in ["plume", "flower", "goblet", "sands", "circlet"]:
+            for x in SLOTS:
+                old_id = old and old[x]
                 if x not in character:
+                    ids[x] = None
+                    if old_id:
+                        deletes["Artifacts"].append((old_id,))
+                        changed = True
                     continue
-                artifact = (
-                    character[x]["setKey"],
-                    character[x]["rarity"],
-                    character[x]["level"],
-                    character[x]["slotKey"],
-                    character[x]["mainStatKey"],
-                    f'{ json.dumps({"substats": character[x]['substats']}) }',
-                )
-                row = cursor.execute(
-                    """
-                    INSERT INTO artifacts (setKey, rarity, level, slotKey, mainStat, substats)
-                    VALUES (?,?,?,?,?,?)
-                    RETURNING id
-                    """,
-                    artifact,
-                )
-                ids[x] = row.fetchone()[0]
 
-            cursor.execute(
-                """
-                    INSERT INTO Characters (name, level, ascension, talent, constellation, weapon, flower, plume, sands, goblet, circlet)
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?)
-                    """,
-                (
-                    character["id"],
-                    character["level"],
-                    character["ascension"],
-                    f"{character['talent']['auto']},{character['talent']['skill']},{character['talent']['burst']}",
-                    character["constellation"],
-                    ids["weapon"],
-                    ids.get("flower"),
-                    ids.get("plume"),
-                    ids.get("sands"),
-                    ids.get("goblet"),
-                    ids.get("circlet"),
-                ),
+                artifact = artifact_values(character[x])
+                if not old_id:
+                    ids[x] = artifact_id
+                    inserts["Artifacts"].append((artifact_id, *artifact))
+                    substats.extend(substat_rows(artifact_id, character[x]["substats"]))
+                    artifact_id += 1
+                    changed = True
+                else:
+                    ids[x] = old_id
+                    if old[f"{x}_fingerprint"] != artifact[-1]:
+                        updates["Artifacts"].append((*artifact, old_id))
+                        substats.extend(substat_rows(old_id, character[x]["substats"]))
+                        changed = True
+
+            values = character_values(character)
+            row = (
+                name,
+                *values[:-1],
+                ids["weapon"],
+                *[ids[x] for x in SLOTS],
+                values[-1],
             )
-            con.commit()
+            if old is None:
+                inserts["Characters"].append(row)
+                summary["added"].append(name)
+            elif changed or old["fingerprint"] != values[-1]:
+                updates["Characters"].append((*row, old["id"]))
+                summary["updated"].append(name)
+            else:
+                summary["unchanged"].append(name)
+
+        # characters that are no longer in the export
+        for name, old in existing.items():
+            deletes["Characters"].append((old["id"],))
+            deletes["Weapons"].append((old["weapon"],))
+            deletes["Artifacts"].extend((old[x],) for x in SLOTS if old[x])
+            summary["removed"].append(name)
+
+        for table in ["Characters", "Weapons", "Artifacts"]:
+            cursor.executemany(f"DELETE FROM {table} WHERE id = ?", deletes[table])
+        cursor.executemany(
+            "DELETE FROM Artifact_Substats WHERE artifact = ?",
+            deletes["Artifacts"] + [(x[-1],) for x in updates["Artifacts"]],
+        )
+
+        cursor.executemany(
+            """
+            INSERT INTO Weapons (id, name, refinement, level, ascension, fingerprint)
+            VALUES (?,?,?,?,?,?)
+            """,
+            inserts["Weapons"],
+        )
+        cursor.executemany(
+            """
+            UPDATE Weapons
+            SET name = ?, refinement = ?, level = ?, ascension = ?, fingerprint = ?
+            WHERE id = ?
+            """,
+            updates["Weapons"],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO Artifacts (id, setKey, rarity, level, slotKey, mainStat, fingerprint)
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            inserts["Artifacts"],
+        )
+        cursor.executemany(
+            """
+            UPDATE Artifacts
+            SET setKey = ?, rarity = ?, level = ?, slotKey = ?, mainStat = ?, fingerprint = ?
+            WHERE id = ?
+            """,
+            updates["Artifacts"],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO Artifact_Substats (artifact, position, key, value)
+            VALUES (?,?,?,?)
+            """,
+            substats,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO Characters (name, level, ascension, talent, constellation, weapon, flower, plume, sands, goblet, circlet, fingerprint)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            inserts["Characters"],
+        )
+        cursor.executemany(
+            """
+            UPDATE Characters
+            SET name = ?, level = ?, ascension = ?, talent = ?, constellation = ?, weapon = ?,
+                flower = ?, plume = ?, sands = ?, goblet = ?, circlet = ?, fingerprint = ?
+            WHERE id = ?
+            """,
+            updates["Characters"],
+        )
+        con.commit()
+
+    dirty_characters.clear()
+    dirty_characters.update(summary["added"], summary["updated"], summary["removed"])
+    return summary
@@ -1,3 +1,11 @@
+import sys
+
+# any arguments mean headless use, which must not pull in tkinter
+if len(sys.argv) > 1:
+    import cli
+
+    sys.exit(cli.main(sys.argv[1:]))
+
 from gui import main_gui
 from loader import create_table
 
@@ -1,172 +1,414 @@
 # uses sqlite database to create gcsim config files, ready to be used with optimisation
+import hashlib
 import json
+import os
+import re
 import sqlite3
-from typing import Any, LiteralString
-
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, LiteralString
+
+import db
+import model
+import stats
 import util
 
 
 def charToConfig(char: dict[str, Any]) -> str:
-    config = ""
-    config += f"{char['name']} char lvl={char['lvl']} cons={char['cons']} talent={char['talent']};\n"
-    config += f"{char['name']} add weapon=\"{char['weapon']['weapon']}\" refine={char['weapon']['refine']} lvl={char['weapon']['lvl']};\n"
+    return model.CharacterBlock.from_dict(char).serialize()
+
+
+def makeCharConfigs(names: list[str] | None = None) -> dict[str, dict[str, Any]]:
+    # builds every requested character (all of them when names is None) from
+    # one query returning a row per character, artifact and substat
+    where = ""
+    if names is not None:
+        if not names:
+            return {}
+        where = f"WHERE Characters.name IN ({','.join(['?'] * len(names))})"
 
-    for k, v in char["sets"].items():
-        config += f"{char['name']} add set=\"{k}\" count={v};\n"
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.row_factory = util.dict_factory
+
+        rows = cursor.execute(
+            f"""
+            SELECT Characters.name, Characters.level, Characters.ascension, Characters.constellation, Characters.talent,
+                Weapons.name AS weapon, Weapons.refinement, Weapons.level AS weapon_level, Weapons.ascension AS weapon_ascension,
+                Artifacts.id AS artifact, Artifacts.setKey, Artifacts.rarity, Artifacts.level AS artifact_level, Artifacts.mainStat,
+                Artifact_Substats.key, Artifact_Substats.value
+            FROM Characters
+            JOIN Weapons ON Weapons.id = Characters.weapon
+            LEFT JOIN Artifacts ON Artifacts.id IN (Characters.flower, Characters.plume, Characters.sands, Characters.goblet, Characters.circlet)
+            LEFT JOIN Artifact_Substats ON Artifact_Substats.artifact = Artifacts.id
+            {where}
+            ORDER BY Characters.id, Artifacts.id, Artifact_Substats.position
+            """,
+            names or (),
+        ).fetchall()
+
+    grouped = {}
+    artifact_substats = {}
+    for row in rows:
+        if row["name"] not in grouped:
+            grouped[row["name"]] = (row, {})
+        if row["artifact"] is not None:
+            grouped[row["name"]][1][row["artifact"]] = row
+            artifact_substats.setdefault(row["artifact"], [])
+            if row["key"]:
+                artifact_substats[row["artifact"]].append((row["key"], row["value"]))
+
+    # one matrix row per artifact across the whole roster, summed per owner
+    owners = []
+    rarities = []
+    main_stat_ids = []
+    levels = []
+    sub_rows = []
+    for owner, (_, artifacts) in enumerate(grouped.values()):
+        for artifact_id, artifact in artifacts.items():
+            owners.append(owner)
+            rarities.append(artifact["rarity"])
+            main_stat_ids.append(util.STAT_IDS[artifact["mainStat"]])
+            levels.append(artifact["artifact_level"])
+            sub_rows.append(stats.substat_row(artifact_substats[artifact_id]))
+
+    main_matrix = stats.main_stat_matrix(rarities, main_stat_ids, levels)
+    main_totals = stats.totals_by_owner(main_matrix, owners, len(grouped))
+    sub_totals = stats.totals_by_owner(stats.matrix(sub_rows), owners, len(grouped))
+
+    return {
+        name: buildCharConfig(
+            row, list(artifacts.values()), main_totals[owner], sub_totals[owner]
+        )
+        for owner, (name, (row, artifacts)) in enumerate(grouped.items())
+    }
+
+
+def buildCharConfig(
+    row: dict[str, Any],
+    artifacts: list[dict[str, Any]],
+    main_total: list[float],
+    sub_total: list[float],
+) -> dict[str, Any]:
+    sets_temp = {}
+    sets = {}
+
+    for artifact in artifacts:
+
+        # count sets
+        if artifact["setKey"] not in sets_temp.keys():
+            sets_temp[artifact["setKey"]] = 1
+        else:
+            sets_temp[artifact["setKey"]] += 1
+
+        for set in sets_temp.keys():
+            if sets_temp[set] >= 2 and sets_temp[set] < 4:
+                sets[util.translate_key("set", set)] = 2
+            elif sets_temp[set] >= 4:
+                sets[util.translate_key("set", set)] = 4
+
+    block = model.CharacterBlock(
+        util.translate_key("character", row["name"]),
+        f"{row['level']}/{util.AscensionToMaxLevel(row['ascension'])}",
+        row["constellation"],
+        row["talent"],
+        model.Weapon(
+            util.translate_key("weapon", row["weapon"]),
+            row["refinement"],
+            f"{row['weapon_level']}/{util.AscensionToMaxLevel(row['weapon_ascension'])}",
+        ),
+        sets,
+        stats.to_sim_stats(main_total),
+        stats.to_sim_stats(sub_total),
+    )
+
+    return {
+        "config": block.serialize(canonical=True),
+        "block": block,
+        "character": row["name"],
+        "constellation": block.cons,
+        "level": block.lvl,
+        "talent": block.talent,
+        "weapon": row["weapon"],
+        "refine": row["refinement"],
+    }
+
+
+def gearFingerprints(names: list[str]) -> dict[str, str | None]:
+    # one hash over the import fingerprints of a character, its weapon and its
+    # artifacts. None for rows imported before fingerprints existed
+    if not names:
+        return {}
+    with db.get_connection() as con:
+        rows = con.execute(
+            f"""
+            SELECT Characters.name, Characters.fingerprint, Weapons.fingerprint,
+                flower.fingerprint, plume.fingerprint, sands.fingerprint, goblet.fingerprint, circlet.fingerprint
+            FROM Characters
+            LEFT JOIN Weapons ON Weapons.id = Characters.weapon
+            LEFT JOIN Artifacts AS flower ON flower.id = Characters.flower
+            LEFT JOIN Artifacts AS plume ON plume.id = Characters.plume
+            LEFT JOIN Artifacts AS sands ON sands.id = Characters.sands
+            LEFT JOIN Artifacts AS goblet ON goblet.id = Characters.goblet
+            LEFT JOIN Artifacts AS circlet ON circlet.id = Characters.circlet
+            WHERE Characters.name IN ({','.join(['?'] * len(names))})
+            """,
+            names,
+        ).fetchall()
 
-    config += f"{char['name']} add stats"
-    config += f" {"hp"}={char["mainStats"]['hp']}"
-    for k, v in char["mainStats"].items():
-        if k == "hp":
+    fingerprints = {}
+    for name, character, weapon, *artifacts in rows:
+        if character is None or weapon is None:
+            fingerprints[name] = None
             continue
-        config += f" {k}={v}"
-    config += ";\n"
+        fingerprints[name] = hashlib.sha1(
+            "|".join([character, weapon, *[x or "" for x in artifacts]]).encode("utf-8")
+        ).hexdigest()
+    return fingerprints
 
-    config += f"{char['name']} add stats"
-    for k, v in char["substats"].items():
-        config += f" {k}={v}"
-    config += ";\n"
 
-    return config
+# character name -> (gear fingerprint, makeCharConfig result), least recently
+# used first. entries are dropped by the import path through
+# invalidateCharConfigs and are ignored when the gear fingerprint has moved on
+char_config_cache = OrderedDict()
+CHAR_CONFIG_CACHE_SIZE = 256
 
 
-def makeCharConfig(c: str) -> dict[str, Any]:
-    with sqlite3.connect("configs.db") as con:
-        con.row_factory = util.dict_factory
+def invalidateCharConfigs(names: Iterable[str] | None = None):
+    if names is None:
+        char_config_cache.clear()
+        return
+    for name in names:
+        char_config_cache.pop(name, None)
 
-        cursor = con.cursor()
 
-        row = cursor.execute(
-            """
-            SELECT *
-            FROM Characters
-            WHERE Characters.name = ?
-            """,
-            (c,),
-        ).fetchone()
+def makeCharConfig(c: str) -> dict[str, Any]:
+    gear = gearFingerprints([c]).get(c)
+    cached = char_config_cache.get(c)
+    if gear is not None and cached is not None and cached[0] == gear:
+        char_config_cache.move_to_end(c)
+        return dict(cached[1])
 
-        char = {
-            "name": util.GOODKeytoGCSIMKey(row["name"]),
-            "lvl": f"{row['level']}/{util.AscensionToMaxLevel(row['ascension'])}",
-            "cons": row["constellation"],
-            "talent": row["talent"],
-        }
+    details = makeCharConfigs([c])[c]
+    if gear is not None:
+        char_config_cache[c] = (gear, details)
+        char_config_cache.move_to_end(c)
+        if len(char_config_cache) > CHAR_CONFIG_CACHE_SIZE:
+            char_config_cache.popitem(last=False)
+    return dict(details)
 
-        weap = cursor.execute(
-            """
-            SELECT *
-            FROM Weapons
-            WHERE id = ?
-            """,
-            (row["weapon"],),
-        ).fetchone()
 
-        char["weapon"] = {
-            "weapon": util.GOODKeytoGCSIMKey(weap["name"]),
-            "refine": weap["refinement"],
-            "lvl": f"{weap['level']}/{util.AscensionToMaxLevel(weap['ascension'])}",
-        }
+def makeTeamConfig(team: list[str]) -> LiteralString:
+    return model.TeamConfig([makeCharConfig(c)["block"] for c in team]).serialize(
+        canonical=True
+    )
 
-        mainStats = {}
-        substats = {}
-        sets_temp = {}
-        sets = {}
 
-        artifacts = cursor.execute(
+def writeConfig(outfile: str, team: list[str]):
+    with open(outfile, "w") as f:
+        f.write(makeTeamConfig(team))
+
+
+def writeFileAtomic(path: str, text: str):
+    # readers of the directory never see a half written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def exportFileNames(names: list[str]) -> dict[str, str]:
+    # config name -> file name, made safe for any filesystem and unique
+    files = {}
+    used = set()
+    for name in names:
+        stem = re.sub(r"[^\w.-]", "_", name).strip(".") or "config"
+        file = f"{stem}.txt"
+        n = 2
+        while file.lower() in used:
+            file = f"{stem}-{n}.txt"
+            n += 1
+        used.add(file.lower())
+        files[name] = file
+    return files
+
+
+def exportFullConfigs(
+    out_dir: str, names: list[str] | None = None, workers: int | None = None
+) -> list[dict[str, Any]]:
+    # writes every full config (or just names) to out_dir as gcsim-ready
+    # files plus a manifest.json describing them. raises KeyError like
+    # makeFullConfigs when a config or its rotation is missing
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        rows = cursor.execute(
+            """
+            SELECT config_name, rotation, character1, character2, character3, character4
+            FROM Full_Configs
             """
-            SELECT *
-            FROM Artifacts
-            WHERE id IN (?, ?, ?, ?, ?)
-            """,
-            (
-                row["flower"],
-                row["plume"],
-                row["sands"],
-                row["goblet"],
-                row["circlet"],
-            ),
         ).fetchall()
-
-        for artifact in artifacts:
-
-            # count sets
-            if artifact["setKey"] not in sets_temp.keys():
-                sets_temp[artifact["setKey"]] = 1
-            else:
-                sets_temp[artifact["setKey"]] += 1
-
-            for set in sets_temp.keys():
-                if sets_temp[set] >= 2 and sets_temp[set] < 4:
-                    sets[util.GOODKeytoGCSIMKey(set)] = 2
-                elif sets_temp[set] >= 4:
-                    sets[util.GOODKeytoGCSIMKey(set)] = 4
-
-            if util.GOODStatToSimStat(artifact["mainStat"]) not in mainStats.keys():
-                mainStats[util.GOODStatToSimStat(artifact["mainStat"])] = (
-                    util.artifact_stats[str(artifact["rarity"])][artifact["mainStat"]][
-                        artifact["level"]
-                    ]
-                )
-            else:
-                mainStats[
-                    util.GOODStatToSimStat(artifact["mainStat"])
-                ] += util.artifact_stats[str(artifact["rarity"])][artifact["mainStat"]][
-                    artifact["level"]
-                ]
-
-            for substat in json.loads(artifact["substats"])["substats"]:
-                if substat["key"] == "":
-                    continue
-                divider = 1
-                if substat["key"].endswith("_"):
-                    divider = 100
-
-                if util.GOODStatToSimStat(substat["key"]) not in substats.keys():
-                    substats[util.GOODStatToSimStat(substat["key"])] = (
-                        substat["value"] / divider
-                    )
-                else:
-                    substats[util.GOODStatToSimStat(substat["key"])] += (
-                        substat["value"] / divider
-                    )
-
-        char["mainStats"] = mainStats
-        char["substats"] = substats
-        char["sets"] = sets
-
-        con.commit()
-
+    details = {row[0]: row for row in rows}
+    if names is None:
+        names = list(details)
+    names = list(dict.fromkeys(names))
+
+    configs = makeFullConfigs(names)
+    files = exportFileNames(names)
+    os.makedirs(out_dir, exist_ok=True)
+
+    def write(name: str) -> dict[str, Any]:
+        text = configs[name]
+        writeFileAtomic(os.path.join(out_dir, files[name]), text)
+        _, rotation, *characters = details[name]
         return {
-            "config": charToConfig(char),
-            "character": row["name"],
-            "constellation": char["cons"],
-            "level": char["lvl"],
-            "talent": char["talent"],
-            "weapon": weap["name"],
-            "refine": weap["refinement"],
+            "name": name,
+            "file": files[name],
+            "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "characters": [x for x in characters if x],
+            "rotation": rotation,
         }
 
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        manifest = list(executor.map(write, names))
+
+    writeFileAtomic(
+        os.path.join(out_dir, "manifest.json"),
+        json.dumps({"configs": manifest}, indent=2) + "\n",
+    )
+    return manifest
+
+
+def updateCharConfigs(
+    cursor: sqlite3.Cursor, saved: list[tuple[str, str]]
+) -> list[str]:
+    # rebuilds the given (config name, character) pairs from the current
+    # import. configs for characters no longer imported are left as they are
+    characters = list({c for (_, c) in saved})
+    fresh = makeCharConfigs(characters)
+    gear = gearFingerprints(characters)
+    rows = []
+    for name, c in saved:
+        if c not in fresh:
+            continue
+        details = fresh[c]
+        rows.append(
+            (
+                details["constellation"],
+                details["level"],
+                details["talent"],
+                details["weapon"],
+                details["refine"],
+                details["config"],
+                gear.get(c),
+                name,
+            )
+        )
 
-def makeTeamConfig(team: list[str]) -> LiteralString:
-    config = "\n".join([makeCharConfig(c)["config"] for c in team])
-    return config
+    cursor.executemany(
+        """
+        UPDATE Character_Configs
+        SET constellation = ?, level = ?, talent = ?, weapon = ?, refine = ?, config = ?, gear_fingerprint = ?
+        WHERE config_name = ?
+        """,
+        rows,
+    )
+    return [x[-1] for x in rows]
+
+
+def regenerateConfigs() -> list[str]:
+    # rebuilds every saved character config from the current import, in one
+    # pass and one transaction
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        saved = cursor.execute(
+            """
+            SELECT config_name, character
+            FROM Character_Configs
+            """
+        ).fetchall()
+        return updateCharConfigs(cursor, saved)
 
 
-def writeConfig(outfile: str, team: list[str]):
-    with open(outfile, "w") as f:
-        f.write(makeTeamConfig(team)["config"])
+def refreshStaleConfigs() -> list[str]:
+    # like regenerateConfigs, but only for the configs whose character's gear
+    # changed since they were saved. configs without a recorded fingerprint
+    # count as stale
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        saved = cursor.execute(
+            """
+            SELECT config_name, character, gear_fingerprint
+            FROM Character_Configs
+            """
+        ).fetchall()
+        gear = gearFingerprints(list({c for (_, c, _) in saved}))
+        stale = [
+            (name, c)
+            for name, c, fingerprint in saved
+            if c in gear and (fingerprint is None or fingerprint != gear[c])
+        ]
+        return updateCharConfigs(cursor, stale)
+
+
+# why diffSavedConfigs couldn't compare a saved config
+NOT_IMPORTED = "character no longer imported"
+UNREADABLE = "saved config could not be parsed"
+
+
+def diffSavedConfigs(
+    names: list[str] | None = None,
+) -> dict[str, list[model.Change] | str]:
+    # compares saved character configs (all of them when names is None)
+    # against what the current import would generate, in one batch. only
+    # configs that differ are returned, configs that can't be compared get
+    # NOT_IMPORTED or UNREADABLE instead of their changes
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        saved = cursor.execute(
+            """
+            SELECT config_name, character, config
+            FROM Character_Configs
+            """
+        ).fetchall()
+    if names is not None:
+        wanted = set(names)
+        saved = [x for x in saved if x[0] in wanted]
+
+    fresh = makeCharConfigs(list({c for (_, c, _) in saved}))
+    changed = {}
+    for name, c, config in saved:
+        if c not in fresh:
+            changed[name] = NOT_IMPORTED
+            continue
+        try:
+            blocks = model.parse(config or "")
+        except ValueError:
+            blocks = []
+        if not blocks:
+            changed[name] = UNREADABLE
+            continue
+        changes = model.diff(blocks[0], fresh[c]["block"])
+        if changes:
+            changed[name] = changes
+    return changed
 
 
 def saveConfig(c: str, name: str):
-    with sqlite3.connect("configs.db") as con:
+    with db.get_connection() as con:
         cursor = con.cursor()
 
         details = makeCharConfig(c)
+        gear = gearFingerprints([c]).get(c)
 
         cursor.execute(
             """
-            INSERT OR REPLACE INTO Character_Configs (config_name, character, constellation, level, talent, weapon, refine, config)
-            VALUES (?,?,?,?,?,?,?,?)
+            INSERT OR REPLACE INTO Character_Configs (config_name, character, constellation, level, talent, weapon, refine, config, gear_fingerprint)
+            VALUES (?,?,?,?,?,?,?,?,?)
             """,
             (
                 name,
@@ -177,5 +419,91 @@ def saveConfig(c: str, name: str):
                 details["weapon"],
                 details["refine"],
                 details["config"],
+                gear,
             ),
         )
+
+
+# name -> (character configs, rotation config), valid while the config
+# generation counter (bumped by triggers on the config tables) is unchanged
+full_config_cache = {}
+full_config_generation = None
+
+
+def makeFullConfigs(names: list[str], require_rotation: bool = True) -> dict[str, str]:
+    # raises KeyError with a readable message when something is missing
+    global full_config_generation
+
+    with db.get_connection() as con:
+        cursor = con.cursor()
+
+        (generation,) = cursor.execute(
+            "SELECT generation FROM Config_Generation"
+        ).fetchone()
+        if generation != full_config_generation:
+            full_config_cache.clear()
+            full_config_generation = generation
+
+        missing = [x for x in dict.fromkeys(names) if x not in full_config_cache]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i : i + 500]
+            cursor.execute(
+                f"""
+                SELECT Full_Configs.config_name, c1.config, c2.config, c3.config, c4.config, Rotation_Configs.config
+                FROM Full_Configs
+                LEFT JOIN Character_Configs AS c1 ON c1.config_name = Full_Configs.character1
+                LEFT JOIN Character_Configs AS c2 ON c2.config_name = Full_Configs.character2
+                LEFT JOIN Character_Configs AS c3 ON c3.config_name = Full_Configs.character3
+                LEFT JOIN Character_Configs AS c4 ON c4.config_name = Full_Configs.character4
+                LEFT JOIN Rotation_Configs ON Rotation_Configs.config_name = Full_Configs.rotation
+                WHERE Full_Configs.config_name IN ({','.join(['?'] * len(chunk))})
+                """,
+                chunk,
+            )
+            for row in cursor.fetchall():
+                full_config_cache[row[0]] = (
+                    "\n".join([x for x in row[1:5] if x]),
+                    row[5],
+                )
+
+    configs = {}
+    for name in names:
+        if name not in full_config_cache:
+            raise KeyError(f"Config {name} not found.")
+        characters, rotation = full_config_cache[name]
+        if rotation is not None:
+            configs[name] = characters + "\n" + rotation
+        elif require_rotation:
+            raise KeyError(f"Config rotation not found.")
+        else:
+            configs[name] = characters
+    return configs
+
+
+def makeFullConfig(name: str, require_rotation: bool = True) -> str:
+    return makeFullConfigs([name], require_rotation)[name]
+
+
+def saveRotationConfig(name: str, config: str):
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO Rotation_Configs (config_name, config)
+            VALUES (?, ?)
+            """,
+            (name, config),
+        )
+
+
+def saveFullConfig(name: str, characters: list[str | None], rotation: str | None):
+    characters = (list(characters) + [None] * 4)[:4]
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO Full_Configs (config_name, rotation, character1, character2, character3, character4)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (name, rotation, *characters),
+        )
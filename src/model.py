@@ -0,0 +1,269 @@
+# in-memory form of gcsim character configs. blocks are built by maker and
+# serialized in one pass, or parsed back from the text stored in the database
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+import util
+
+# canonical text: stats in STAT_KEYS order, sets by name, numbers rounded to
+# PRECISION decimals without trailing zeros, so identical builds give
+# identical bytes whatever order the artifacts were read in
+PRECISION = 6
+STAT_ORDER = {
+    key: i for i, key in enumerate(util.translate_keys("stat", util.STAT_KEYS).values())
+}
+
+
+def format_number(value: int | float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    text = f"{value:.{PRECISION}f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def canonical_stats(stats: dict[str, int | float]) -> list[tuple[str, str]]:
+    return [
+        (k, format_number(stats[k]))
+        for k in sorted(stats, key=lambda k: (STAT_ORDER.get(k, len(STAT_ORDER)), k))
+    ]
+
+
+def normalize_whitespace(text: str) -> str:
+    # unix line endings, single spaces, no trailing blanks or blank lines
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+@dataclass(slots=True)
+class Weapon:
+    key: str
+    refine: int
+    lvl: str
+
+
+@dataclass(slots=True)
+class CharacterBlock:
+    name: str
+    lvl: str
+    cons: int
+    talent: str
+    weapon: Weapon
+    sets: dict[str, int] = field(default_factory=dict)
+    main_stats: dict[str, int | float] = field(default_factory=dict)
+    substats: dict[str, int | float] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, char: dict[str, Any]) -> "CharacterBlock":
+        # the dict shape maker.charToConfig has always taken
+        return cls(
+            char["name"],
+            char["lvl"],
+            char["cons"],
+            char["talent"],
+            Weapon(
+                char["weapon"]["weapon"],
+                char["weapon"]["refine"],
+                char["weapon"]["lvl"],
+            ),
+            dict(char["sets"]),
+            dict(char["mainStats"]),
+            dict(char["substats"]),
+        )
+
+    def parts(self, canonical: bool = False) -> list[str]:
+        name = self.name
+        parts = [
+            f"{name} char lvl={self.lvl} cons={self.cons} talent={self.talent};\n",
+            f'{name} add weapon="{self.weapon.key}" refine={self.weapon.refine} lvl={self.weapon.lvl};\n',
+        ]
+        sets = sorted(self.sets.items()) if canonical else self.sets.items()
+        for k, v in sets:
+            parts.append(f'{name} add set="{k}" count={v};\n')
+
+        if canonical:
+            for stats in (self.main_stats, self.substats):
+                parts.append(f"{name} add stats")
+                for k, v in canonical_stats(stats):
+                    parts.append(f" {k}={v}")
+                parts.append(";\n")
+            return parts
+
+        # hp always leads the main stat line
+        parts.append(f"{name} add stats")
+        if "hp" in self.main_stats:
+            parts.append(f" hp={self.main_stats['hp']}")
+        for k, v in self.main_stats.items():
+            if k != "hp":
+                parts.append(f" {k}={v}")
+        parts.append(";\n")
+
+        parts.append(f"{name} add stats")
+        for k, v in self.substats.items():
+            parts.append(f" {k}={v}")
+        parts.append(";\n")
+        return parts
+
+    def serialize(self, canonical: bool = False) -> str:
+        return "".join(self.parts(canonical))
+
+    def digest(self) -> str:
+        return hashlib.sha256(self.serialize(True).encode("utf-8")).hexdigest()
+
+
+@dataclass(slots=True)
+class TeamConfig:
+    characters: list[CharacterBlock]
+    rotation: str | None = None
+
+    def serialize(self, canonical: bool = False) -> str:
+        parts = []
+        for i, block in enumerate(self.characters):
+            if i:
+                parts.append("\n")
+            parts.extend(block.parts(canonical))
+        if self.rotation is not None:
+            parts.append("\n")
+            parts.append(
+                normalize_whitespace(self.rotation) if canonical else self.rotation
+            )
+        return "".join(parts)
+
+    def digest(self) -> str:
+        return hashlib.sha256(self.serialize(True).encode("utf-8")).hexdigest()
+
+
+line_pattern = re.compile(r"^(\S+) (char|add weapon=|add set=|add stats)(.*);$")
+option_pattern = re.compile(r'(\w[\w%]*)=("[^"]*"|\S+)')
+
+
+def number(value: str) -> int | float:
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse(text: str) -> list[CharacterBlock]:
+    # reads character blocks in the format CharacterBlock.serialize writes.
+    # lines that aren't part of a character block (a rotation) are skipped.
+    # raises ValueError for a stats line without a char line before it
+    blocks = {}
+    stats_lines = {}
+    for line in text.splitlines():
+        match = line_pattern.match(line.strip())
+        if not match:
+            continue
+        name, kind, rest = match.groups()
+        if kind in ("add weapon=", "add set="):
+            rest = kind.split()[1] + rest
+        options = {k: v.strip('"') for k, v in option_pattern.findall(rest)}
+
+        if kind == "char":
+            blocks[name] = CharacterBlock(
+                name,
+                options.get("lvl", ""),
+                number(options.get("cons", "0")),
+                options.get("talent", ""),
+                Weapon("", 1, ""),
+            )
+            stats_lines[name] = 0
+            continue
+        if name not in blocks:
+            raise ValueError(f"{name} has no char line.")
+        block = blocks[name]
+
+        if kind == "add weapon=":
+            block.weapon = Weapon(
+                options["weapon"],
+                number(options.get("refine", "1")),
+                options.get("lvl", ""),
+            )
+        elif kind == "add set=":
+            block.sets[options["set"]] = number(options.get("count", "0"))
+        else:
+            # the first stats line holds the main stats, the second the substats
+            stats = block.main_stats if stats_lines[name] == 0 else block.substats
+            stats_lines[name] += 1
+            for k, v in options.items():
+                stats[k] = number(v)
+    return list(blocks.values())
+
+
+@dataclass(slots=True)
+class Change:
+    # section is one of "char", "weapon", "set", "main", "sub". a set or stat
+    # missing on one side is None or 0 there
+    section: str
+    key: str
+    old: Any
+    new: Any
+
+    def delta(self) -> float | None:
+        numeric = (int, float)
+        if isinstance(self.old, numeric) and isinstance(self.new, numeric):
+            return self.new - self.old
+        return None
+
+    def __str__(self) -> str:
+        if self.section == "char" or self.key == "weapon":
+            label = self.key
+        elif self.section == "set":
+            label = f'set "{self.key}"'
+        else:
+            label = f"{self.section} {self.key}"
+
+        delta = self.delta()
+        if self.section not in ("set", "main", "sub") or delta is None:
+            old = "-" if self.old is None else self.old
+            new = "-" if self.new is None else self.new
+            return f"{label}: {old} -> {new}"
+        sign = "+" if delta > 0 else ""
+        return f"{label}: {format_number(self.old)} -> {format_number(self.new)} ({sign}{format_number(delta)})"
+
+
+def same(old: Any, new: Any) -> bool:
+    numeric = (int, float)
+    if isinstance(old, numeric) and isinstance(new, numeric):
+        return format_number(old) == format_number(new)
+    return old == new
+
+
+def diff(old: CharacterBlock, new: CharacterBlock) -> list[Change]:
+    changes = []
+    for key, a, b in (
+        ("lvl", old.lvl, new.lvl),
+        ("cons", old.cons, new.cons),
+        ("talent", old.talent, new.talent),
+    ):
+        if not same(a, b):
+            changes.append(Change("char", key, a, b))
+
+    for key, a, b in (
+        ("weapon", old.weapon.key, new.weapon.key),
+        ("refine", old.weapon.refine, new.weapon.refine),
+        ("lvl", old.weapon.lvl, new.weapon.lvl),
+    ):
+        if not same(a, b):
+            changes.append(Change("weapon", key, a, b))
+
+    for key in sorted(old.sets.keys() | new.sets.keys()):
+        a, b = old.sets.get(key), new.sets.get(key)
+        if a != b:
+            changes.append(Change("set", key, a, b))
+
+    for section, a_stats, b_stats in (
+        ("main", old.main_stats, new.main_stats),
+        ("sub", old.substats, new.substats),
+    ):
+        keys = a_stats.keys() | b_stats.keys()
+        for key in sorted(keys, key=lambda k: (STAT_ORDER.get(k, len(STAT_ORDER)), k)):
+            a, b = a_stats.get(key, 0), b_stats.get(key, 0)
+            if not same(a, b):
+                changes.append(Change(section, key, a, b))
+    return changes
+
+
+def format_changes(changes: list[Change]) -> str:
+    return "\n".join(str(x) for x in changes)
@@ -0,0 +1,369 @@
+# summary statistics of gcsim output files, kept in Sim_Results so runs can be
+# ranked and compared without reopening the json
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import Any, TextIO
+
+import db
+import model
+import util
+
+
+def config_hash(config: str) -> str:
+    return hashlib.sha256(
+        model.normalize_whitespace(config).encode("utf-8")
+    ).hexdigest()
+
+
+def summary_stat(stat: dict[str, Any] | None) -> tuple:
+    # gcsim SummaryStat: mean, min, max and sd (std in some versions)
+    stat = stat or {}
+    return (
+        stat.get("mean"),
+        stat.get("min"),
+        stat.get("max"),
+        stat.get("sd", stat.get("std")),
+    )
+
+
+def parse_result(data: dict[str, Any], config: str = "") -> dict[str, Any]:
+    # character names come from character_details when gcsim wrote them, from
+    # the config otherwise. both are in team order
+    statistics = data.get("statistics") or {}
+    character_dps = statistics.get("character_dps") or []
+
+    names = [x.get("name") for x in data.get("character_details") or []]
+    if len(names) < len(character_dps):
+        names = [x.name for x in model.parse(config)]
+    names += [f"character{i + 1}" for i in range(len(names), len(character_dps))]
+
+    duration = statistics.get("duration")
+    return {
+        "sim_version": data.get("sim_version"),
+        "iterations": statistics.get("iterations"),
+        "duration": (
+            summary_stat(duration)[0] if isinstance(duration, dict) else duration
+        ),
+        "dps": summary_stat(statistics.get("dps")),
+        "characters": [
+            (name, *summary_stat(stat)) for name, stat in zip(names, character_dps)
+        ],
+    }
+
+
+# the parts of a gcsim result parse_result reads. True takes the whole value,
+# a dict descends into an object, "*" into every item of an array
+RESULT_FIELDS = {
+    "sim_version": True,
+    "config_file": True,
+    "character_details": {"*": {"name": True}},
+    "statistics": {
+        "iterations": True,
+        "duration": True,
+        "dps": True,
+        "character_dps": True,
+    },
+}
+
+whitespace_end = re.compile(r"\S")
+string_token = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+scalar_end = re.compile(r"[,}\]\s]")
+structure = re.compile(r'[{}\[\]"]')
+decoder = json.JSONDecoder()
+
+
+class JSONStream:
+    # pulls selected fields out of a json document read in chunks. skipped
+    # values are scanned with regexes and never decoded, so memory stays at
+    # about one chunk plus whatever was selected
+    CHUNK = 1 << 16
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.mark = None
+
+    def fill(self) -> bool:
+        # drops text before pos (or mark while capturing), False at the end
+        chunk = self.f.read(self.CHUNK)
+        if not chunk:
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            match = whitespace_end.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                raise ValueError("Unexpected end of json.")
+
+    def take(self, expected: str):
+        if self.peek() not in expected:
+            raise ValueError(f"Expected {expected!r} at {self.buf[self.pos]!r}.")
+        c = self.buf[self.pos]
+        self.pos += 1
+        return c
+
+    def string_end(self) -> int:
+        while True:
+            match = string_token.match(self.buf, self.pos)
+            if match:
+                return match.end()
+            if not self.fill():
+                raise ValueError("Unterminated string in json.")
+
+    def read_string(self) -> str:
+        self.peek()
+        end = self.string_end()
+        value = json.loads(self.buf[self.pos : end])
+        self.pos = end
+        return value
+
+    def skip(self):
+        c = self.peek()
+        if c == '"':
+            self.pos = self.string_end()
+            return
+        if c not in "{[":
+            while True:
+                match = scalar_end.search(self.buf, self.pos)
+                if match:
+                    self.pos = match.start()
+                    return
+                self.pos = len(self.buf)
+                if not self.fill():
+                    return
+
+        depth = 0
+        while True:
+            match = structure.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError("Unexpected end of json.")
+                continue
+            self.pos = match.start()
+            c = match.group()
+            if c == '"':
+                self.pos = self.string_end()
+                continue
+            if c in "{[":
+                # values that fit in the buffer go through the C decoder,
+                # which is much faster than scanning them here
+                try:
+                    self.pos = decoder.raw_decode(self.buf, self.pos)[1]
+                    if depth == 0:
+                        return
+                    continue
+                except ValueError:
+                    pass
+            self.pos += 1
+            depth += 1 if c in "{[" else -1
+            if depth == 0:
+                return
+
+    def capture(self) -> Any:
+        self.peek()
+        self.mark = self.pos
+        try:
+            self.skip()
+            return json.loads(self.buf[self.mark : self.pos])
+        finally:
+            self.mark = None
+
+    def select(self, selector: dict | bool) -> Any:
+        # values the selector doesn't reach are skipped and come back as None
+        if selector is True:
+            return self.capture()
+
+        c = self.peek()
+        if c == "{":
+            self.pos += 1
+            result = {}
+            if self.peek() == "}":
+                self.pos += 1
+                return result
+            while True:
+                key = self.read_string()
+                self.take(":")
+                if key in selector:
+                    result[key] = self.select(selector[key])
+                else:
+                    self.skip()
+                if self.take(",}") == "}":
+                    return result
+
+        if c == "[" and "*" in selector:
+            self.pos += 1
+            result = []
+            if self.peek() == "]":
+                self.pos += 1
+                return result
+            while True:
+                result.append(self.select(selector["*"]))
+                if self.take(",]") == "]":
+                    return result
+
+        self.skip()
+        return None
+
+
+def open_result(path: str) -> TextIO:
+    # gcsim results may be stored gzipped
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    if gzipped:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def extract(path: str, selector: dict = RESULT_FIELDS) -> dict[str, Any]:
+    with open_result(path) as f:
+        return JSONStream(f).select(selector) or {}
+
+
+def load_result(out_path: str, config: str = "") -> dict[str, Any] | None:
+    # None when gcsim didn't write the file or it isn't valid json
+    if not os.path.isfile(out_path):
+        return None
+    try:
+        return parse_result(extract(out_path), config)
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+def store_result(
+    config_name: str, config: str, out_path: str, options: str = ""
+) -> int | None:
+    # returns the Sim_Results id, or None when there was nothing to store
+    result = load_result(out_path, config)
+    if result is None:
+        return None
+    return store_parsed(config_name, config, result, options)
+
+
+def store_parsed(
+    config_name: str, config: str, result: dict[str, Any], options: str = ""
+) -> int:
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        key = (config_name, config_hash(config), options)
+        cursor.execute(
+            """
+            DELETE FROM Sim_Result_Characters
+            WHERE result IN (
+                SELECT id FROM Sim_Results
+                WHERE config_name = ? AND config_hash = ? AND options = ?
+            )
+            """,
+            key,
+        )
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO Sim_Results (config_name, config_hash, options, sim_version, iterations, duration, dps_mean, dps_min, dps_max, dps_std)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+            """,
+            (
+                *key,
+                result["sim_version"],
+                result["iterations"],
+                result["duration"],
+                *result["dps"],
+            ),
+        )
+        result_id = cursor.lastrowid
+        cursor.executemany(
+            """
+            INSERT INTO Sim_Result_Characters (result, position, character, dps_mean, dps_min, dps_max, dps_std)
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            [
+                (result_id, position, *character)
+                for position, character in enumerate(result["characters"])
+            ],
+        )
+    return result_id
+
+
+def ingest_directory(
+    out_dir: str, configs: dict[str, str] | None = None, options: str = ""
+) -> list[str]:
+    # stores every <config>.json(.gz) in out_dir, one file at a time. the
+    # config text comes from configs, or from the config_file gcsim embeds
+    stored = []
+    for entry in sorted(os.scandir(out_dir), key=lambda x: x.name):
+        name = entry.name
+        for suffix in (".json", ".json.gz"):
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+                break
+        else:
+            continue
+        if not entry.is_file():
+            continue
+
+        # a broken file, or a config model.parse can't take names from, is
+        # left out instead of ending the whole ingest
+        try:
+            data = extract(entry.path)
+            config = (configs or {}).get(name) or data.get("config_file")
+            if not isinstance(config, str):
+                continue
+            result = parse_result(data, config)
+        except (OSError, ValueError, EOFError):
+            continue
+        store_parsed(name, config, result, options)
+        stored.append(name)
+    return stored
+
+
+def ranking(
+    limit: int | None = None, config_names: list[str] | None = None
+) -> list[dict[str, Any]]:
+    # the latest result of every config, best mean dps first
+    where = ""
+    if config_names is not None:
+        if not config_names:
+            return []
+        where = f"AND config_name IN ({','.join(['?'] * len(config_names))})"
+
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.row_factory = util.dict_factory
+        return cursor.execute(
+            f"""
+            SELECT id, config_name, config_hash, options, created, iterations, duration, dps_mean, dps_min, dps_max, dps_std
+            FROM Sim_Results
+            WHERE id IN (SELECT MAX(id) FROM Sim_Results GROUP BY config_name) {where}
+            ORDER BY dps_mean DESC
+            LIMIT ?
+            """,
+            (*(config_names or ()), -1 if limit is None else limit),
+        ).fetchall()
+
+
+def character_results(result_id: int) -> list[dict[str, Any]]:
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.row_factory = util.dict_factory
+        return cursor.execute(
+            """
+            SELECT character, dps_mean, dps_min, dps_max, dps_std
+            FROM Sim_Result_Characters
+            WHERE result = ?
+            ORDER BY position
+            """,
+            (result_id,),
+        ).fetchall()
@@ -0,0 +1,688 @@
+# runs assembled gcsim configs, optionally several at the same time
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable
+
+import db
+import model
+
+
+exe_hashes = {}
+exe_hashes_lock = threading.Lock()
+
+# gcsim processes that are running, by config name, so they can be cancelled.
+# cancel requests for names that haven't started their process yet are kept
+# in cancel_requests, batch_cancelled stops jobs that haven't started at all
+processes = {}
+cancel_requests = set()
+processes_lock = threading.Lock()
+batch_cancelled = threading.Event()
+
+# worker daemons (worker.py) a batch can be sent to instead. remote_jobs maps
+# a config name to the worker and job id running it, for cancel. a worker
+# that fails is left alone for WORKER_RETRY_DELAY seconds, a job gives up
+# after REMOTE_ATTEMPTS failed workers. a worker with every slot taken by
+# someone else is waited for REMOTE_BUSY_RETRIES times, backing off. a
+# running job's worker sends a byte every WORKER_HEARTBEAT seconds, one
+# silent for WORKER_SILENCE_TIMEOUT is taken as lost
+DEFAULT_WORKER_PORT = 8765
+WORKER_TOKEN_HEADER = "X-Worker-Token"
+WORKER_RETRY_DELAY = 30
+REMOTE_ATTEMPTS = 3
+REMOTE_BUSY_RETRIES = 8
+WORKER_HEARTBEAT = 5
+WORKER_SILENCE_TIMEOUT = 30
+worker_token = os.environ.get("GCSIM_WORKER_TOKEN")
+remote_jobs = {}
+workers_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def make_options_string(
+    substat_optimizer: bool = True,
+    fine_tune: bool = True,
+    liquid_substats: str | int | None = 20,
+    liquid_cap: str | int | None = 10,
+    fixed_substats: str | int | None = 2,
+) -> str:
+    if not substat_optimizer:
+        return ""
+    # 0 is a setting of its own, only None or an empty box leave a value out
+    options = '-substatOptimFull -options="'
+    if liquid_substats is not None and liquid_substats != "":
+        options += f"total_liquid_substats={liquid_substats};"
+    if liquid_cap is not None and liquid_cap != "":
+        options += f"indiv_liquid_cap={liquid_cap};"
+    if fixed_substats is not None and fixed_substats != "":
+        options += f"fixed_substats_count={fixed_substats};"
+    options += f'fine_tune={1 if fine_tune else 0};"'
+    return options
+
+
+# the shape of what make_options_string returns, the only options a worker
+# passes on to gcsim
+options_pattern = re.compile(
+    r'-substatOptimFull -options="'
+    r"(?:(?:total_liquid_substats|indiv_liquid_cap|fixed_substats_count|fine_tune)"
+    r'=\d+(?:\.\d+)?;)*"'
+)
+
+
+def valid_options(options: str) -> bool:
+    return options == "" or options_pattern.fullmatch(options) is not None
+
+
+def exe_identity(exe_path: str) -> str:
+    # hashing the binary is slow, so it's only redone when size or mtime change
+    # and run_batch does it once before its threads start
+    stat = os.stat(exe_path)
+    key = (os.path.abspath(exe_path), stat.st_size, stat.st_mtime_ns)
+    with exe_hashes_lock:
+        if key not in exe_hashes:
+            h = hashlib.sha256()
+            with open(exe_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            exe_hashes[key] = f"{stat.st_size}:{stat.st_mtime_ns}:{h.hexdigest()}"
+        return exe_hashes[key]
+
+
+def cache_key(
+    exe_path: str | None, config: str, options: str, identity: str | None = None
+) -> str:
+    # whitespace-only edits to a config don't change its key. identity stands
+    # in for exe_path when gcsim is on another machine
+    h = hashlib.sha256()
+    identity = identity or exe_identity(exe_path)
+    for part in (model.normalize_whitespace(config), options, identity):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def cache_dir() -> str:
+    # the cached output and result files live next to configs.db, Sim_Cache
+    # holds their paths relative to this
+    return os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), "sim_cache")
+
+
+def get_cached_result(key: str) -> tuple[str, str | None] | None:
+    # the output and result file of key, the result is None when gcsim
+    # didn't write one
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute(
+            """
+            SELECT output_path, result_path
+            FROM Sim_Cache
+            WHERE cache_key = ?
+            """,
+            (key,),
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return tuple(None if x is None else os.path.join(cache_dir(), x) for x in row)
+
+
+def load_cached_result(
+    key: str, out_path: str, on_line: Callable[[str], None] | None = None
+) -> dict[str, Any] | None:
+    # files deleted from the cache directory count as not cached
+    cached = get_cached_result(key)
+    if not cached:
+        return None
+    output_path, result_path = cached
+    try:
+        with open(output_path, "r", encoding="utf-8", newline="") as f:
+            output = f.read()
+        if result_path is not None:
+            shutil.copyfile(result_path, out_path)
+    except OSError:
+        return None
+    if on_line:
+        for line in output.splitlines(keepends=True):
+            on_line(line)
+    return {"returncode": 0, "output": output, "cached": True}
+
+
+def write_cache_file(path: str, write: Callable[[str], None]):
+    # write fills a temporary file, readers never see a half written one
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def store_cached_result(key: str, output: str, out_path: str):
+    # the files are in place before the row pointing at them
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    def write_output(path: str):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(output)
+
+    output_file = f"{key}.txt"
+    write_cache_file(os.path.join(directory, output_file), write_output)
+    size = os.path.getsize(os.path.join(directory, output_file))
+    result_file = None
+    if os.path.isfile(out_path):
+        result_file = f"{key}.json"
+        write_cache_file(
+            os.path.join(directory, result_file),
+            lambda path: shutil.copyfile(out_path, path),
+        )
+        size += os.path.getsize(os.path.join(directory, result_file))
+
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO Sim_Cache (cache_key, output_path, result_path, size)
+            VALUES (?, ?, ?, ?)
+            """,
+            (key, output_file, result_file, size),
+        )
+
+
+def clear_cache():
+    with db.get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute("DELETE FROM Sim_Cache")
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+
+
+def kill_tree(sim: subprocess.Popen):
+    # gcsim runs in its own process group (session on posix), so anything it
+    # started goes down with it
+    if sim.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/T", "/F", "/PID", str(sim.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return
+        os.killpg(sim.pid, signal.SIGTERM)
+        try:
+            sim.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        os.killpg(sim.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def cancel_remote(address: str, job: str):
+    # sent from a thread, a worker that doesn't answer mustn't block the gui
+    def send():
+        try:
+            worker_request(address, "/cancel", {"job": job}, timeout=10)
+        except (OSError, ValueError):
+            pass
+
+    threading.Thread(target=send, daemon=True).start()
+
+
+def forget_cancel(name: str):
+    # drops a cancel request that came in after name finished
+    with processes_lock:
+        cancel_requests.discard(name)
+
+
+def cancel(name: str) -> bool:
+    # stops the gcsim run for name, True when it was running. a run that is
+    # about to start is stopped as soon as its process exists
+    with processes_lock:
+        cancel_requests.add(name)
+        sim = processes.get(name)
+        remote = remote_jobs.get(name)
+    if remote:
+        cancel_remote(*remote)
+        return True
+    if sim is None:
+        return False
+    kill_tree(sim)
+    return True
+
+
+def cancel_batch():
+    # stops every running gcsim process, jobs that haven't started are skipped
+    batch_cancelled.set()
+    with processes_lock:
+        running = list(processes.values())
+        remote = list(remote_jobs.values())
+    for job in remote:
+        cancel_remote(*job)
+    for sim in running:
+        kill_tree(sim)
+
+
+def run_sim(
+    exe_path: str,
+    config: str,
+    out_path: str,
+    browser: bool = False,
+    options: str = "",
+    on_line: Callable[[str], None] | None = None,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    name: str | None = None,
+    identity: str | None = None,
+) -> dict[str, Any]:
+    # browser runs are never cached, the point of those is to open the viewer.
+    # after timeout seconds gcsim is killed, the output so far is kept. name
+    # registers the process for cancel, identity is exe_identity(exe_path)
+    # when the caller already has it
+    key = None
+    if use_cache and not browser:
+        key = cache_key(exe_path, config, options, identity)
+        cached = load_cached_result(key, out_path, on_line)
+        if cached:
+            return cached
+
+    with tempfile.NamedTemporaryFile(
+        mode="w", suffix=".txt", encoding="utf-8", delete_on_close=False
+    ) as temp_config_file:
+        temp_config_file.write(config)
+        temp_config_file.close()
+
+        arglist = [exe_path, "-c", temp_config_file.name, "-out", out_path]
+        if browser:
+            arglist.append("-s")
+        if options:
+            arglist.extend(options.split(" "))
+
+        output = []
+        stopped = []
+        with subprocess.Popen(
+            args=arglist,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            start_new_session=os.name != "nt",
+            creationflags=(
+                subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
+            ),
+        ) as sim:
+            if name is not None:
+                with processes_lock:
+                    processes[name] = sim
+                    cancelled = name in cancel_requests or batch_cancelled.is_set()
+                if cancelled:
+                    threading.Thread(target=kill_tree, args=(sim,), daemon=True).start()
+
+            def expire():
+                stopped.append(f"timed out after {timeout:g}s")
+                kill_tree(sim)
+
+            timer = None
+            if timeout:
+                timer = threading.Timer(timeout, expire)
+                timer.daemon = True
+                timer.start()
+            try:
+                for line in sim.stdout:
+                    output.append(line)
+                    if on_line:
+                        on_line(line)
+                sim.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+                if name is not None:
+                    with processes_lock:
+                        processes.pop(name, None)
+                        cancelled = name in cancel_requests or batch_cancelled.is_set()
+                        cancel_requests.discard(name)
+                    if cancelled and sim.returncode != 0:
+                        stopped.append("cancelled")
+
+    if stopped:
+        note = f"\n[GCSim {stopped[0]}]\n"
+        output.append(note)
+        if on_line:
+            on_line(note)
+
+    output = "".join(output)
+    if key and sim.returncode == 0 and not stopped:
+        store_cached_result(key, output, out_path)
+
+    return {
+        "returncode": sim.returncode,
+        "output": output,
+        "cached": False,
+        "stopped": stopped[0] if stopped else None,
+    }
+
+
+def parse_addresses(text: str) -> list[str]:
+    # "host:port, host2" -> worker addresses, the port defaults to the worker's
+    return [
+        x if ":" in x else f"{x}:{DEFAULT_WORKER_PORT}"
+        for x in re.split(r"[\s,]+", text.strip())
+        if x
+    ]
+
+
+def worker_request(
+    address: str, path: str, body: dict | None = None, timeout: float | None = None
+) -> dict[str, Any]:
+    headers = {"Content-Type": "application/json"}
+    if worker_token:
+        headers[WORKER_TOKEN_HEADER] = worker_token
+    request = urllib.request.Request(
+        f"http://{address}{path}",
+        data=None if body is None else json.dumps(body).encode("utf-8"),
+        headers=headers,
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def connect_workers(addresses: list[str]) -> dict[str, dict[str, Any]]:
+    # the workers that answer, with their slots and gcsim identity. load is
+    # the number of jobs sent to a worker and not answered yet
+    def status(address: str) -> dict[str, Any] | None:
+        try:
+            return worker_request(address, "/status", timeout=10)
+        except (OSError, ValueError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(addresses) or 1) as pool:
+        statuses = list(pool.map(status, addresses))
+    return {
+        address: {
+            "slots": max(1, int(x.get("slots") or 1)),
+            "exe": x.get("exe"),
+            "load": 0,
+            "retry_at": 0.0,
+        }
+        for address, x in zip(addresses, statuses)
+        if x is not None
+    }
+
+
+def pick_worker(workers: dict[str, dict[str, Any]]) -> str | None:
+    # the least loaded worker for its slots, skipping the ones that just failed
+    now = time.monotonic()
+    with workers_lock:
+        ready = [x for x in workers if workers[x]["retry_at"] <= now]
+        if not ready:
+            return None
+        address = min(ready, key=lambda x: workers[x]["load"] / workers[x]["slots"])
+        workers[address]["load"] += 1
+    return address
+
+
+def run_remote(
+    workers: dict[str, dict[str, Any]],
+    config: str,
+    out_path: str,
+    options: str = "",
+    on_line: Callable[[str], None] | None = None,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    name: str | None = None,
+) -> dict[str, Any]:
+    # run_sim on a worker from connect_workers. the result json is written to
+    # out_path like a local run, the output comes in one piece at the end. a
+    # worker that can't be reached or drops the job is retried on another;
+    # when none are left the job comes back skipped so it can be resumed
+    if use_cache:
+        for identity in {x["exe"] for x in workers.values() if x["exe"]}:
+            cached = load_cached_result(
+                cache_key(None, config, options, identity), out_path, on_line
+            )
+            if cached:
+                return cached
+
+    errors = []
+    busy_waits = 0
+    while len(errors) < REMOTE_ATTEMPTS:
+        address = pick_worker(workers)
+        if address is None:
+            break
+        # a new id per attempt, so cancelling an abandoned one can't hit the retry
+        job = uuid.uuid4().hex
+
+        with processes_lock:
+            cancelled = name in cancel_requests or batch_cancelled.is_set()
+            if name is not None and not cancelled:
+                remote_jobs[name] = (address, job)
+        if cancelled:
+            with workers_lock:
+                workers[address]["load"] -= 1
+            output = "\n[GCSim cancelled]\n"
+            if on_line:
+                on_line(output)
+            return {
+                "returncode": None,
+                "output": output,
+                "cached": False,
+                "stopped": "cancelled",
+            }
+
+        busy = False
+        lost = False
+        refused = None
+        try:
+            response = worker_request(
+                address,
+                "/run",
+                {"job": job, "config": config, "options": options, "timeout": timeout},
+                # the worker enforces timeout, this only catches one gone quiet
+                timeout=WORKER_SILENCE_TIMEOUT,
+            )
+        except urllib.error.HTTPError as e:
+            if e.code in (400, 403):
+                # the job itself was turned down, another worker would too
+                try:
+                    refused = json.loads(e.read())["error"]
+                except (OSError, ValueError, KeyError, TypeError):
+                    refused = str(e)
+            busy = e.code == 503
+            errors.append(f"{address}: {e}")
+            response = None
+        except (OSError, ValueError) as e:
+            # the worker may still be running it
+            lost = True
+            errors.append(f"{address}: {e}")
+            response = None
+        finally:
+            with processes_lock:
+                remote_jobs.pop(name, None)
+            with workers_lock:
+                workers[address]["load"] -= 1
+
+        if refused is not None:
+            with processes_lock:
+                cancel_requests.discard(name)
+            output = f"GCSim worker {address} refused this config: {refused}\n"
+            if on_line:
+                on_line(output)
+            return {
+                "returncode": None,
+                "output": output,
+                "cached": False,
+                "stopped": None,
+                "worker": address,
+            }
+        if response is None:
+            if lost:
+                cancel_remote(address, job)
+            if busy and busy_waits < REMOTE_BUSY_RETRIES:
+                # another client got there first, not a fault of the worker
+                errors.pop()
+                time.sleep(min(2**busy_waits, 30))
+                busy_waits += 1
+            elif not busy:
+                with workers_lock:
+                    workers[address]["retry_at"] = time.monotonic() + WORKER_RETRY_DELAY
+            continue
+
+        with processes_lock:
+            cancel_requests.discard(name)
+        if response.get("result") is not None:
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(response["result"])
+        output = response.get("output") or ""
+        if on_line:
+            for line in output.splitlines(keepends=True):
+                on_line(line)
+        result = {
+            "returncode": response.get("returncode"),
+            "output": output,
+            "cached": False,
+            "stopped": response.get("stopped"),
+            "worker": address,
+        }
+        if use_cache and result["returncode"] == 0 and not result["stopped"]:
+            store_cached_result(
+                cache_key(None, config, options, workers[address]["exe"]),
+                output,
+                out_path,
+            )
+        return result
+
+    output = "No GCSim worker could run this config.\n" + "".join(
+        f"  {x}\n" for x in errors
+    )
+    if on_line:
+        on_line(output)
+    return {"returncode": None, "output": output, "skipped": True}
+
+
+def run_batch(
+    exe_path: str,
+    configs: dict[str, str],
+    out_dir: str,
+    browser: bool = False,
+    options: str = "",
+    workers: int | None = None,
+    on_result: Callable[[str, dict[str, Any]], None] | None = None,
+    on_line: Callable[[str, str], None] | None = None,
+    use_cache: bool = True,
+    on_start: Callable[[str], None] | None = None,
+    timeout: float | None = None,
+    remote: list[str] | None = None,
+) -> dict[str, dict[str, Any]]:
+    # every config gets its own gcsim process, at most `workers` at a time.
+    # on_start is called from the worker thread just before a config runs,
+    # results are handed to on_result in completion order, not queue order.
+    # after cancel_batch the configs that haven't started come back with
+    # skipped set and returncode None. with remote worker addresses the
+    # configs run there instead, `workers` defaults to their total slots.
+    # browser runs stay local, the viewer has to open on this machine, and
+    # run one at a time since every gcsim -s serves on the same local port
+    results = {}
+    pool = None
+    if remote and not browser:
+        pool = connect_workers(remote)
+        if not pool:
+            raise ConnectionError("None of the GCSim workers could be reached.")
+        workers = workers or sum(x["slots"] for x in pool.values())
+    workers = max(1, min(workers or default_workers(), len(configs) or 1))
+    if browser:
+        workers = 1
+    identity = None
+    if use_cache and not browser and pool is None:
+        # a missing gcsim fails every job on its own below
+        try:
+            identity = exe_identity(exe_path)
+        except OSError:
+            pass
+    batch_cancelled.clear()
+    with processes_lock:
+        cancel_requests.clear()
+
+    def start(
+        name: str, config: str, on_line: Callable[[str], None] | None
+    ) -> dict[str, Any]:
+        # the pool's threads end with the batch, so the connection the cache
+        # and on_start open in one is closed after every job
+        try:
+            return run_job(name, config, on_line)
+        finally:
+            db.close_connection()
+
+    def run_job(
+        name: str, config: str, on_line: Callable[[str], None] | None
+    ) -> dict[str, Any]:
+        if batch_cancelled.is_set():
+            return {"returncode": None, "output": "", "skipped": True}
+        if on_start:
+            on_start(name)
+        out_path = os.path.join(out_dir, f"{name}.json")
+        if pool is not None:
+            return run_remote(
+                pool, config, out_path, options, on_line, use_cache, timeout, name
+            )
+        return run_sim(
+            exe_path,
+            config,
+            out_path,
+            browser,
+            options,
+            on_line,
+            use_cache,
+            timeout,
+            name,
+            identity,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                start,
+                name,
+                config,
+                on_line and (lambda line, name=name: on_line(name, line)),
+            ): name
+            for name, config in configs.items()
+        }
+
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except OSError as e:
+                    result = {
+                        "returncode": None,
+                        "output": f"Failed to start GCSim: {e}",
+                    }
+                results[name] = result
+                if on_result:
+                    on_result(name, result)
+        except BaseException:
+            # ctrl+c doesn't reach gcsim in its own session, stop it here or
+            # the pool would wait for every job before the exception gets out
+            cancel_batch()
+            raise
+
+    return results
@@ -0,0 +1,130 @@
+# artifact stats as fixed-width vectors, one column per util.STAT_KEYS entry.
+# a set of artifacts is a matrix with a row per artifact, so totals for one
+# character, many characters or many artifact combinations are matrix sums.
+# numpy is used when it is installed, plain lists otherwise
+from typing import Any, Sequence
+
+import util
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STAT_INDEX = util.STAT_IDS
+WIDTH = len(util.STAT_KEYS)
+SIM_KEYS = list(util.translate_keys("stat", util.STAT_KEYS).values())
+
+# GOOD substats are in percent for the keys ending in "_", gcsim wants fractions
+SUBSTAT_SCALE = [0.01 if key.endswith("_") else 1.0 for key in util.STAT_KEYS]
+
+
+def main_stat_row(rarity: int, stat_id: int, level: int) -> list[float]:
+    row = [0.0] * WIDTH
+    row[stat_id] = util.main_stat_value(rarity, stat_id, level)
+    return row
+
+
+def main_stat_matrix(
+    rarities: Sequence[int], stat_ids: Sequence[int], levels: Sequence[int]
+) -> Any:
+    # one row per artifact with only its main stat set, read straight from
+    # util.main_stat_table. the offsets are util.main_stat_offset's worked
+    # out on the whole arrays, the first bad row goes through it to raise
+    if np is not None:
+        count = len(stat_ids)
+        ids = np.asarray(stat_ids, dtype=np.intp)
+        rarities = np.asarray(rarities, dtype=np.intp)
+        levels = np.asarray(levels, dtype=np.intp)
+        slots = rarities * WIDTH + ids
+        known = (
+            (rarities >= 0)
+            & (rarities < util.MAIN_STAT_RARITIES)
+            & (ids >= 0)
+            & (ids < WIDTH)
+        )
+        level_counts = np.zeros(count, dtype=np.intp)
+        level_counts[known] = np.frombuffer(util.main_stat_levels, dtype=np.uint8)[
+            slots[known]
+        ]
+        valid = (levels >= 0) & (levels < level_counts)
+        if not valid.all():
+            bad = int(np.argmin(valid))
+            util.main_stat_offset(int(rarities[bad]), int(ids[bad]), int(levels[bad]))
+        offsets = slots * util.MAIN_STAT_LEVELS + levels
+        result = np.zeros((count, WIDTH))
+        result[np.arange(count), ids] = np.frombuffer(util.main_stat_table)[offsets]
+        return result
+    return [
+        main_stat_row(rarity, stat_id, level)
+        for rarity, stat_id, level in zip(rarities, stat_ids, levels)
+    ]
+
+
+def substat_row(substats: Sequence[tuple[str, float]]) -> list[float]:
+    row = [0.0] * WIDTH
+    for key, value in substats:
+        i = STAT_INDEX[key]
+        row[i] += value * SUBSTAT_SCALE[i]
+    return row
+
+
+def matrix(rows: list[list[float]]) -> Any:
+    if np is not None:
+        return np.array(rows, dtype=np.float64).reshape(len(rows), WIDTH)
+    return rows
+
+
+def totals(m: Any) -> list[float]:
+    if np is not None:
+        return m.sum(axis=0).tolist()
+    result = [0.0] * WIDTH
+    for row in m:
+        for i, value in enumerate(row):
+            result[i] += value
+    return result
+
+
+def totals_by_owner(m: Any, owners: Sequence[int], count: int) -> list[list[float]]:
+    # owners[i] is the index (0..count-1) of the character artifact row i belongs to
+    if np is not None:
+        result = np.zeros((count, WIDTH))
+        if len(owners):
+            np.add.at(result, np.asarray(owners, dtype=np.intp), m)
+        return result.tolist()
+    result = [[0.0] * WIDTH for _ in range(count)]
+    for owner, row in zip(owners, m):
+        total = result[owner]
+        for i, value in enumerate(row):
+            total[i] += value
+    return result
+
+
+def score_combinations(
+    m: Any, combinations: Sequence[Sequence[int]], weights: Sequence[float]
+) -> list[float]:
+    # each combination is a list of artifact row indices, scored as the
+    # weighted sum of its stat totals
+    if np is not None:
+        if not len(combinations):
+            return []
+        picked = m[np.asarray(combinations, dtype=np.intp)]
+        return (picked.sum(axis=1) @ np.asarray(weights, dtype=np.float64)).tolist()
+    scores = []
+    for combination in combinations:
+        total = [0.0] * WIDTH
+        for index in combination:
+            for i, value in enumerate(m[index]):
+                total[i] += value
+        scores.append(sum(x * w for x, w in zip(total, weights)))
+    return scores
+
+
+def to_sim_stats(total: Sequence[float]) -> dict[str, float]:
+    # gcsim stat name -> value for every stat present, in STAT_KEYS order.
+    # whole numbers (flat main stats) are written without a trailing .0
+    return {
+        key: int(value) if value.is_integer() else value
+        for key, value in zip(SIM_KEYS, total)
+        if value
+    }
@@ -1,47 +1,63 @@
+import functools
 import re
 import sqlite3
+from array import array
+from typing import Any, Iterable
+
+
+# GOOD stat key -> gcsim stat key
+STAT_SIM_KEYS = {
+    "hp": "hp",
+    "hp_": "hp%",
+    "atk": "atk",
+    "atk_": "atk%",
+    "def": "def",
+    "def_": "def%",
+    "eleMas": "em",
+    "enerRech_": "er",
+    "heal_": "heal",
+    "critRate_": "cr",
+    "critDMG_": "cd",
+    "physical_dmg_": "phys%",
+    "anemo_dmg_": "anemo%",
+    "geo_dmg_": "geo%",
+    "electro_dmg_": "electro%",
+    "hydro_dmg_": "hydro%",
+    "pyro_dmg_": "pyro%",
+    "cryo_dmg_": "cryo%",
+    "dendro_dmg_": "dendro%",
+}
 
 
 def GOODStatToSimStat(key: str):
-    match key:
-        case "hp":
-            return "hp"
-        case "hp_":
-            return "hp%"
-        case "atk":
-            return "atk"
-        case "atk_":
-            return "atk%"
-        case "def":
-            return "def"
-        case "def_":
-            return "def%"
-        case "eleMas":
-            return "em"
-        case "enerRech_":
-            return "er"
-        case "heal_":
-            return "heal"
-        case "critRate_":
-            return "cr"
-        case "critDMG_":
-            return "cd"
-        case "physical_dmg_":
-            return "phys%"
-        case "anemo_dmg_":
-            return "anemo%"
-        case "geo_dmg_":
-            return "geo%"
-        case "electro_dmg_":
-            return "electro%"
-        case "hydro_dmg_":
-            return "hydro%"
-        case "pyro_dmg_":
-            return "pyro%"
-        case "cryo_dmg_":
-            return "cryo%"
-        case "dendro_dmg_":
-            return "dendro%"
+    return STAT_SIM_KEYS.get(key)
+
+
+# every GOOD stat key, in the order stats are laid out in stat vectors
+STAT_KEYS = [
+    "hp",
+    "hp_",
+    "atk",
+    "atk_",
+    "def",
+    "def_",
+    "eleMas",
+    "enerRech_",
+    "heal_",
+    "critRate_",
+    "critDMG_",
+    "physical_dmg_",
+    "anemo_dmg_",
+    "geo_dmg_",
+    "electro_dmg_",
+    "hydro_dmg_",
+    "pyro_dmg_",
+    "cryo_dmg_",
+    "dendro_dmg_",
+]
+
+# integer stat id for every GOOD stat key, the column in stat vectors
+STAT_IDS = {key: i for i, key in enumerate(STAT_KEYS)}
 
 
 def AscensionToMaxLevel(ascension: int):
@@ -68,33 +84,66 @@ def dict_factory(cursor: sqlite3.Cursor, row):
 
 
 # https://github.com/genshinsim/gcsim/blob/main/ui/packages/ui/src/Pages/Simulator/Components/GOOD/GOODToSrl.functions.ts
-def GOODKeytoGCSIMKey(goodKey: str) -> str:
-    match goodKey:
-        case "KaedeharaKazuha":
-            return "kazuha"
-        case "KamisatoAyaka":
-            return "ayaka"
-        case "KamisatoAyato":
-            return "ayato"
-        case "KujouSara":
-            return "sara"
-        case "RaidenShogun":
-            return "raiden"
-        case "SangonomiyaKokomi":
-            return "kokomi"
-        case "YaeMiko":
-            return "yaemiko"
-        case "AratakiItto":
-            return "itto"
-        case "ShikanoinHeizou":
-            return "heizou"
-        case "KukiShinobu":
-            return "kuki"
+# GOOD key -> gcsim key, for the keys where stripping everything but letters
+# and digits and lowercasing isn't enough
+CHARACTER_KEYS = {
+    "KaedeharaKazuha": "kazuha",
+    "KamisatoAyaka": "ayaka",
+    "KamisatoAyato": "ayato",
+    "KujouSara": "sara",
+    "RaidenShogun": "raiden",
+    "SangonomiyaKokomi": "kokomi",
+    "YaeMiko": "yaemiko",
+    "AratakiItto": "itto",
+    "ShikanoinHeizou": "heizou",
+    "KukiShinobu": "kuki",
+}
+
+# weapons and sets have no exceptions, their gcsim key is always the
+# normalized GOOD key, so only characters and stats have a table
+KEY_KINDS = ("character", "weapon", "set", "stat")
+KEY_TABLES = {
+    "character": CHARACTER_KEYS,
+    "stat": STAT_SIM_KEYS,
+}
+
+non_alphanumeric = re.compile(r"[^0-9a-z]", re.IGNORECASE)
+
+
+@functools.cache
+def translate_key(kind: str, goodKey: str) -> str | None:
+    # kind is one of KEY_KINDS. stats are only ever looked up, anything
+    # else falls back to the normalized key
+    if kind not in KEY_KINDS:
+        raise KeyError(kind)
+    table = KEY_TABLES.get(kind, {})
+    if goodKey in table or kind == "stat":
+        return table.get(goodKey)
+    return non_alphanumeric.sub("", goodKey).lower()
 
-    result = str(goodKey)
-    result = re.sub(r"/[^0-9a-z]/gi", "", result).lower()
 
-    return result
+def translate_keys(kind: str, keys: Iterable[str]) -> dict[str, str | None]:
+    return {key: translate_key(kind, key) for key in keys}
+
+
+def translate_export(good: dict[str, Any]) -> dict[str, dict[str, str | None]]:
+    # every key in a GOOD export, translated once and grouped by kind
+    artifacts = good.get("artifacts", [])
+    stat_keys = {x["mainStatKey"] for x in artifacts}
+    for x in artifacts:
+        stat_keys.update(s["key"] for s in x["substats"] if s["key"])
+    return {
+        "character": translate_keys(
+            "character", {x["key"] for x in good.get("characters", [])}
+        ),
+        "weapon": translate_keys("weapon", {x["key"] for x in good.get("weapons", [])}),
+        "set": translate_keys("set", {x["setKey"] for x in artifacts}),
+        "stat": translate_keys("stat", stat_keys),
+    }
+
+
+def GOODKeytoGCSIMKey(goodKey: str) -> str:
+    return translate_key("character", goodKey)
 
 
 artifact_stats = {
@@ -1153,3 +1202,42 @@ artifact_stats = {
         ],
     },
 }
+
+
+# artifact_stats as one dense table of doubles, indexed by (rarity, stat id,
+# level) through main_stat_offset. built once at import. main_stat_levels
+# holds how many levels each (rarity, stat id) has, 0 for stats an artifact
+# can't have as its main stat
+MAIN_STAT_RARITIES = 6
+MAIN_STAT_LEVELS = 21
+
+main_stat_table = array(
+    "d", bytes(8 * MAIN_STAT_RARITIES * len(STAT_KEYS) * MAIN_STAT_LEVELS)
+)
+main_stat_levels = array("B", bytes(MAIN_STAT_RARITIES * len(STAT_KEYS)))
+for _rarity, _stats in artifact_stats.items():
+    for _key, _values in _stats.items():
+        _slot = int(_rarity) * len(STAT_KEYS) + STAT_IDS[_key]
+        main_stat_levels[_slot] = len(_values)
+        _offset = _slot * MAIN_STAT_LEVELS
+        main_stat_table[_offset : _offset + len(_values)] = array("d", _values)
+del _rarity, _stats, _key, _values, _slot, _offset
+
+
+def main_stat_offset(rarity: int, stat_id: int, level: int) -> int:
+    # raises like the artifact_stats lookup it replaces: KeyError for a main
+    # stat the rarity doesn't have, IndexError for a level past its max
+    slot = rarity * len(STAT_KEYS) + stat_id
+    if not (
+        0 <= rarity < MAIN_STAT_RARITIES
+        and 0 <= stat_id < len(STAT_KEYS)
+        and main_stat_levels[slot]
+    ):
+        raise KeyError(f"No {rarity}* main stat with id {stat_id}.")
+    if not 0 <= level < main_stat_levels[slot]:
+        raise IndexError(f"Level {level} is out of range for a {rarity}* artifact.")
+    return slot * MAIN_STAT_LEVELS + level
+
+
+def main_stat_value(rarity: int, stat_id: int, level: int) -> float:
+    return main_stat_table[main_stat_offset(rarity, stat_id, level)]
@@ -0,0 +1,272 @@
+# runs gcsim for other machines, started with `main.py worker`. jobs come in
+# as json over http and go through runner.run_sim on this machine's gcsim,
+# runner.run_batch spreads a batch over these when given worker addresses.
+# the token, when set, has to match GCSIM_WORKER_TOKEN on the sending side,
+# and is required when listening on anything but loopback. options have to
+# look like runner.make_options_string's, nothing else reaches gcsim's argv
+#
+#   GET  /status  -> {"slots", "busy", "exe"}
+#   POST /run     {"job", "config", "options", "timeout"} ->
+#                 {"returncode", "output", "result", "stopped"}, 503 when full,
+#                 preceded by a space every runner.WORKER_HEARTBEAT seconds
+#   POST /cancel  {"job"} -> {"cancelled"}
+import hmac
+import ipaddress
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db
+import runner
+
+
+class WorkerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, exe_path: str, slots: int, token: str | None):
+        super().__init__(address, WorkerHandler)
+        self.exe_path = exe_path
+        self.slots = slots
+        self.token = token
+        self.busy = 0
+        # ids of the jobs accepted and not answered yet, cancel only counts
+        # for these
+        self.jobs = set()
+        self.lock = threading.Lock()
+
+    def process_request_thread(self, request, client_address):
+        # every request gets a thread of its own, a connection opened in it
+        # is closed with it
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            db.close_connection()
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    server: WorkerServer
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self) -> bool:
+        if self.server.token and not hmac.compare_digest(
+            (self.headers.get(runner.WORKER_TOKEN_HEADER) or "").encode("utf-8"),
+            self.server.token.encode("utf-8"),
+        ):
+            self.send_json(403, {"error": "Bad worker token."})
+            return False
+        return True
+
+    def read_json(self) -> dict | None:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            self.send_json(400, {"error": "Expected a json object."})
+            return None
+        return body
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path != "/status":
+            self.send_json(404, {"error": "Not found."})
+            return
+        self.send_json(
+            200,
+            {
+                "slots": self.server.slots,
+                "busy": self.server.busy,
+                "exe": runner.exe_identity(self.server.exe_path),
+            },
+        )
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path == "/cancel":
+            body = self.read_json()
+            if body is not None:
+                self.send_json(200, {"cancelled": self.cancel(str(body.get("job")))})
+            return
+        if self.path != "/run":
+            self.send_json(404, {"error": "Not found."})
+            return
+
+        body = self.read_json()
+        if body is None:
+            return
+        try:
+            job = read_job(body)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        with self.server.lock:
+            if self.server.busy >= self.server.slots:
+                self.send_json(503, {"error": "All slots busy."})
+                return
+            if job["name"] in self.server.jobs:
+                self.send_json(400, {"error": "Job already running."})
+                return
+            self.server.busy += 1
+            self.server.jobs.add(job["name"])
+        try:
+            self.send_running(job)
+        finally:
+            with self.server.lock:
+                self.server.busy -= 1
+                self.server.jobs.discard(job["name"])
+                runner.forget_cancel(job["name"])
+
+    def send_running(self, job: dict):
+        # the status goes out now and a space every runner.WORKER_HEARTBEAT
+        # seconds until the json, which json.loads skips, so the client can
+        # tell a long sim from a dead worker. a client that went away gets
+        # its job cancelled
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(runner.WORKER_HEARTBEAT):
+                try:
+                    self.wfile.write(b" ")
+                    self.wfile.flush()
+                except OSError:
+                    self.cancel(job["name"])
+                    return
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            try:
+                result = run_job(self.server.exe_path, job)
+            except Exception as e:
+                result = {"returncode": None, "output": f"{e}\n", "result": None}
+        finally:
+            done.set()
+            beat.join()
+        self.wfile.write(json.dumps(result).encode("utf-8"))
+
+    def cancel(self, job: str) -> bool:
+        # a job that finished between the check and runner.cancel loses its
+        # cancel request again, so those don't pile up
+        with self.server.lock:
+            if job not in self.server.jobs:
+                return False
+        cancelled = runner.cancel(job)
+        with self.server.lock:
+            if job not in self.server.jobs:
+                runner.forget_cancel(job)
+        return cancelled
+
+    def log_message(self, format: str, *args):
+        sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+
+def read_job(body: dict) -> dict:
+    # the checked parts of a /run body, ValueError says what is wrong
+    config = body.get("config")
+    if not isinstance(config, str):
+        raise ValueError("Missing config.")
+
+    options = body.get("options") or ""
+    if not isinstance(options, str) or not runner.valid_options(options):
+        raise ValueError("Unsupported gcsim options.")
+
+    timeout = body.get("timeout")
+    if timeout is not None:
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+            raise ValueError("Timeout must be a number of seconds.")
+        if not math.isfinite(timeout) or timeout < 0:
+            raise ValueError("Timeout must be a non-negative number of seconds.")
+        timeout = float(timeout) or None
+
+    name = body.get("job")
+    if not isinstance(name, str) or not name:
+        raise ValueError("Missing job id.")
+
+    return {"config": config, "options": options, "timeout": timeout, "name": name}
+
+
+def run_job(exe_path: str, job: dict) -> dict:
+    # the local cache is skipped, the dispatching side keeps its own
+    fd, out_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    os.remove(out_path)
+    try:
+        result = runner.run_sim(
+            exe_path,
+            job["config"],
+            out_path,
+            options=job["options"],
+            use_cache=False,
+            timeout=job["timeout"],
+            name=job["name"],
+        )
+        output = None
+        if os.path.isfile(out_path):
+            with open(out_path, "r", encoding="utf-8") as f:
+                output = f.read()
+        return {
+            "returncode": result["returncode"],
+            "output": result["output"],
+            "result": output,
+            "stopped": result.get("stopped"),
+        }
+    finally:
+        if os.path.isfile(out_path):
+            os.remove(out_path)
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        addresses = socket.getaddrinfo(host, None)
+    except OSError:
+        return False
+    return all(
+        ipaddress.ip_address(x[4][0].split("%")[0]).is_loopback for x in addresses
+    )
+
+
+def serve(
+    exe_path: str,
+    host: str = "127.0.0.1",
+    port: int = runner.DEFAULT_WORKER_PORT,
+    slots: int | None = None,
+    token: str | None = None,
+):
+    # anyone who can reach the port can run sims, so off this machine a token
+    # is required
+    if not token and not is_loopback(host):
+        raise ValueError("A worker token is required to listen beyond localhost.")
+    server = WorkerServer(
+        (host, port), exe_path, slots or runner.default_workers(), token
+    )
+    print(
+        f"GCSim worker on {host}:{server.server_address[1]} with {server.slots} slot(s).",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        runner.cancel_batch()
+    finally:
+        server.server_close()
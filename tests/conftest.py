@@ -0,0 +1,87 @@
+# shared fixtures: a throwaway configs.db and small synthetic GOOD exports
+import copy
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import db
+import loader
+import maker
+
+SLOTS = ["flower", "plume", "sands", "goblet", "circlet"]
+MAIN_STATS = {
+    "flower": ["hp"],
+    "plume": ["atk"],
+    "sands": ["atk_", "hp_", "eleMas", "enerRech_"],
+    "goblet": ["pyro_dmg_", "hydro_dmg_", "atk_"],
+    "circlet": ["critRate_", "critDMG_", "atk_"],
+}
+SUBSTATS = ["hp", "hp_", "atk", "atk_", "def", "eleMas", "critRate_", "critDMG_"]
+CHARACTERS = ["HuTao", "Xingqiu", "Bennett", "KaedeharaKazuha", "YaeMiko"]
+SETS = ["CrimsonWitchOfFlames", "EmblemOfSeveredFate", "ViridescentVenerer"]
+WEAPONS = ["StaffOfHoma", "SacrificialSword", "TheCatch"]
+
+
+def good_export(seed: int = 0, characters: list[str] = CHARACTERS) -> dict:
+    r = random.Random(seed)
+    good = {"format": "GOOD", "characters": [], "weapons": [], "artifacts": []}
+    for key in characters:
+        good["characters"].append(
+            {
+                "key": key,
+                "id": key,
+                "level": r.choice([80, 90]),
+                "ascension": 6,
+                "constellation": r.randint(0, 6),
+                "talent": {"auto": r.randint(1, 10), "skill": 9, "burst": 10},
+            }
+        )
+        good["weapons"].append(
+            {
+                "key": r.choice(WEAPONS),
+                "level": 90,
+                "ascension": 6,
+                "refinement": r.randint(1, 5),
+                "location": key,
+            }
+        )
+        for slot in SLOTS:
+            main = r.choice(MAIN_STATS[slot])
+            good["artifacts"].append(
+                {
+                    "setKey": r.choice(SETS),
+                    "rarity": 5,
+                    "level": r.choice([16, 20]),
+                    "slotKey": slot,
+                    "mainStatKey": main,
+                    "location": key,
+                    "substats": [
+                        {"key": x, "value": round(r.uniform(1, 20), 1)}
+                        for x in r.sample([x for x in SUBSTATS if x != main], 4)
+                    ],
+                }
+            )
+    return good
+
+
+def import_export(good: dict, incremental: bool = False) -> dict[str, list[str]]:
+    loader.load(copy.deepcopy(good))
+    return loader.export(incremental=incremental)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # every test gets its own configs.db in its own directory, and empty
+    # config caches
+    db.close_connection()
+    maker.invalidateCharConfigs()
+    monkeypatch.setattr(maker, "full_config_generation", None)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "configs.db"))
+    loader.create_table()
+    yield tmp_path
+    db.close_connection()
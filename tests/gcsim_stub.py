@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# stands in for gcsim in the tests: takes -c and -out, prints a few lines and
+# writes a small result. a "# stub sleep=<seconds>" line in the config makes
+# it take that long, "# stub fail" makes it exit 1
+import json
+import sys
+import time
+
+args = sys.argv[1:]
+with open(args[args.index("-c") + 1], "r", encoding="utf-8") as f:
+    config = f.read()
+out_path = args[args.index("-out") + 1]
+
+seconds = 0.0
+for line in config.splitlines():
+    if line.startswith("# stub sleep="):
+        seconds = float(line.split("=", 1)[1])
+    elif line == "# stub fail":
+        print("stub failure", flush=True)
+        sys.exit(1)
+
+print(f"stub running {' '.join(args[4:])}".rstrip(), flush=True)
+time.sleep(seconds)
+with open(out_path, "w", encoding="utf-8") as f:
+    json.dump({"sim_version": "stub", "config_file": config}, f)
+print("stub done", flush=True)
@@ -0,0 +1,158 @@
+# an incremental export has to leave the import tables as a full one would,
+# compared by content since the ids differ
+import copy
+
+import pytest
+
+import db
+import loader
+
+from conftest import CHARACTERS, good_export, import_export
+
+
+def snapshot() -> dict:
+    # every character with its weapon and artifacts inlined, plus whatever
+    # no character points at any more
+    with db.get_connection() as con:
+        substats = {}
+        for artifact, *row in con.execute(
+            "SELECT artifact, position, key, value FROM Artifact_Substats ORDER BY artifact, position"
+        ):
+            substats.setdefault(artifact, []).append(tuple(row))
+        artifacts = {
+            row[0]: (*row[1:], tuple(substats.pop(row[0], ())))
+            for row in con.execute(
+                "SELECT id, setKey, rarity, level, slotKey, mainStat, fingerprint FROM Artifacts"
+            )
+        }
+        weapons = {
+            row[0]: row[1:]
+            for row in con.execute(
+                "SELECT id, name, refinement, level, ascension, fingerprint FROM Weapons"
+            )
+        }
+        characters = {}
+        for row in con.execute(
+            f"""
+            SELECT name, level, ascension, talent, constellation, fingerprint, weapon, {", ".join(loader.SLOTS)}
+            FROM Characters
+            """
+        ):
+            characters[row[0]] = (
+                *row[1:6],
+                weapons.pop(row[6]),
+                *[x and artifacts.pop(x) for x in row[7:]],
+            )
+    return {
+        "characters": characters,
+        "weapons": sorted(weapons.values()),
+        "artifacts": sorted(artifacts.values()),
+        "substats": sorted(substats),
+    }
+
+
+def owned(good: dict, kind: str, owner: str, slot: str | None = None) -> dict:
+    return next(
+        x
+        for x in good[kind]
+        if x["location"] == owner and (slot is None or x["slotKey"] == slot)
+    )
+
+
+def remove_character(good: dict):
+    for kind in ("characters", "weapons", "artifacts"):
+        good[kind] = [
+            x for x in good[kind] if x.get("location", x.get("key")) != "Bennett"
+        ]
+
+
+def swap_artifacts(good: dict):
+    # the game swaps when a piece is equipped from someone else
+    hutao = owned(good, "artifacts", "HuTao", "flower")
+    xingqiu = owned(good, "artifacts", "Xingqiu", "flower")
+    hutao["location"], xingqiu["location"] = "Xingqiu", "HuTao"
+
+
+def move_artifact(good: dict):
+    # HuTao's sands goes to YaeMiko, whose own sands goes back to the bag
+    owned(good, "artifacts", "YaeMiko", "sands")["location"] = ""
+    owned(good, "artifacts", "HuTao", "sands")["location"] = "YaeMiko"
+
+
+def upgrade_artifact(good: dict):
+    artifact = owned(good, "artifacts", "Xingqiu", "goblet")
+    artifact["level"] = 20
+    artifact["substats"][0]["value"] += 5.8
+
+
+def swap_weapons(good: dict):
+    hutao = owned(good, "weapons", "HuTao")
+    bennett = owned(good, "weapons", "Bennett")
+    hutao["location"], bennett["location"] = "Bennett", "HuTao"
+
+
+def replace_weapon(good: dict):
+    weapon = owned(good, "weapons", "YaeMiko")
+    weapon["location"] = ""
+    good["weapons"].append({**weapon, "key": "TheCatch", "refinement": 5})
+    good["weapons"][-1]["location"] = "YaeMiko"
+
+
+def refine_weapon(good: dict):
+    weapon = owned(good, "weapons", "Xingqiu")
+    weapon["refinement"] = weapon["refinement"] % 5 + 1
+
+
+def add_character(good: dict):
+    extra = good_export(7, characters=["Zhongli"])
+    for kind in ("characters", "weapons", "artifacts"):
+        good[kind].extend(extra[kind])
+
+
+# in an order that lets them all apply to one export
+CHANGES = [
+    swap_artifacts,
+    move_artifact,
+    upgrade_artifact,
+    swap_weapons,
+    replace_weapon,
+    refine_weapon,
+    add_character,
+    remove_character,
+]
+
+
+def full_snapshot(good: dict) -> dict:
+    import_export(good)
+    return snapshot()
+
+
+@pytest.mark.parametrize("changes", [[x] for x in CHANGES] + [CHANGES])
+def test_incremental_matches_full(database, changes):
+    before = good_export(0)
+    after = copy.deepcopy(before)
+    for change in changes:
+        change(after)
+    expected = full_snapshot(after)
+
+    import_export(before)
+    summary = import_export(after, incremental=True)
+
+    assert snapshot() == expected
+    assert expected["weapons"] == expected["artifacts"] == expected["substats"] == []
+    assert sorted(summary["unchanged"] + summary["updated"] + summary["added"]) == (
+        sorted(expected["characters"])
+    )
+
+
+def test_repeated_incremental_imports(database):
+    # unrelated exports one after another, the roster shrinking and growing
+    exports = [
+        good_export(seed, characters=CHARACTERS[: 5 - seed % 3]) for seed in range(1, 7)
+    ]
+    expected = [full_snapshot(x) for x in exports]
+
+    import_export(good_export(0))
+    for good, state in zip(exports, expected):
+        import_export(good, incremental=True)
+        assert snapshot() == state
@@ -0,0 +1,53 @@
+import db
+import maker
+
+from conftest import good_export, import_export
+
+
+def save_all(names: list[str]):
+    for name in names:
+        maker.saveConfig(name, f"c_{name}")
+
+
+def test_diff_reports_each_saved_config(database):
+    import_export(good_export(0))
+    save_all(["HuTao", "Xingqiu", "Bennett"])
+    with db.get_connection() as con:
+        con.execute(
+            "UPDATE Character_Configs SET config = ? WHERE config_name = ?",
+            ("hutao add stats hp=1;", "c_HuTao"),
+        )
+        con.execute(
+            "UPDATE Character_Configs SET config = ? WHERE config_name = ?",
+            ("", "c_Bennett"),
+        )
+
+    changed = maker.diffSavedConfigs()
+
+    assert changed == {"c_HuTao": maker.UNREADABLE, "c_Bennett": maker.UNREADABLE}
+
+
+def test_diff_after_reimport(database):
+    good = good_export(0)
+    import_export(good)
+    save_all(["HuTao", "Xingqiu", "Bennett"])
+    with db.get_connection() as con:
+        con.execute(
+            "UPDATE Character_Configs SET config = ? WHERE config_name = ?",
+            ("garbage", "c_HuTao"),
+        )
+
+    good["characters"] = [x for x in good["characters"] if x["key"] != "Bennett"]
+    good["weapons"] = [x for x in good["weapons"] if x["location"] != "Bennett"]
+    good["artifacts"] = [x for x in good["artifacts"] if x["location"] != "Bennett"]
+    xingqiu = next(x for x in good["characters"] if x["key"] == "Xingqiu")
+    xingqiu["constellation"] = (xingqiu["constellation"] + 1) % 7
+    import_export(good, incremental=True)
+
+    changed = maker.diffSavedConfigs()
+
+    assert changed["c_HuTao"] == maker.UNREADABLE
+    assert changed["c_Bennett"] == maker.NOT_IMPORTED
+    assert [(x.key, x.new) for x in changed["c_Xingqiu"]] == [
+        ("cons", xingqiu["constellation"])
+    ]
@@ -0,0 +1,217 @@
+# a configs.db as the first release wrote it, brought up to date by
+# loader.create_table's migrations
+import copy
+import json
+import sqlite3
+
+import pytest
+
+import db
+import loader
+
+from conftest import good_export, import_export
+from test_loader import full_snapshot, snapshot
+
+# the tables exactly as the first release created them
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Characters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    ascension INTEGER NOT NULL,
+    talent TEXT NOT NULL,
+    constellation INTEGER NOT NULL,
+    weapon INTEGER NOT NULL REFERENCES Weapons(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    flower INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    plume INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    sands INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    goblet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    circlet INTEGER REFERENCES Artifacts(id) ON UPDATE RESTRICT ON DELETE RESTRICT
+);
+CREATE TABLE IF NOT EXISTS Weapons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    refinement INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    ascension INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Artifacts(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    setKey TEXT NOT NULL,
+    rarity INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    slotKey TEXT NOT NULL,
+    mainStat TEXT NOT NULL,
+    substats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Character_Configs(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_name TEXT UNIQUE NOT NULL,
+    character TEXT NOT NULL,
+    constellation INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    talent TEXT NOT NULL,
+    weapon TEXT NOT NULL,
+    refine INTEGER NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Rotation_Configs(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_name TEXT UNIQUE NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Full_Configs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_name TEXT UNIQUE NOT NULL,
+    character1 TEXT REFERENCES Character_Configs(config_name) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    character2 TEXT REFERENCES Character_Configs(config_name) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    character3 TEXT REFERENCES Character_Configs(config_name) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    character4 TEXT REFERENCES Character_Configs(config_name) ON UPDATE RESTRICT ON DELETE RESTRICT,
+    rotation TEXT REFERENCES Rotation_Configs(config_name) ON UPDATE RESTRICT ON DELETE RESTRICT
+);
+"""
+
+
+def baseline_export(con: sqlite3.Connection, good: dict):
+    # the rows the first release's loader.export wrote, substats as json
+    loader.load(good)
+    for character in loader.characters.values():
+        weapon = character["weapon"]
+        weapon_id = con.execute(
+            "INSERT INTO Weapons (name, refinement, level, ascension) VALUES (?,?,?,?)",
+            (weapon["key"], weapon["refinement"], weapon["level"], weapon["ascension"]),
+        ).lastrowid
+        ids = {}
+        for x in loader.SLOTS:
+            if x not in character:
+                continue
+            artifact = character[x]
+            ids[x] = con.execute(
+                """
+                INSERT INTO Artifacts (setKey, rarity, level, slotKey, mainStat, substats)
+                VALUES (?,?,?,?,?,?)
+                """,
+                (
+                    artifact["setKey"],
+                    artifact["rarity"],
+                    artifact["level"],
+                    artifact["slotKey"],
+                    artifact["mainStatKey"],
+                    json.dumps({"substats": artifact["substats"]}),
+                ),
+            ).lastrowid
+        con.execute(
+            """
+            INSERT INTO Characters (name, level, ascension, talent, constellation, weapon, flower, plume, sands, goblet, circlet)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            (
+                character["id"],
+                character["level"],
+                character["ascension"],
+                f"{character['talent']['auto']},{character['talent']['skill']},{character['talent']['burst']}",
+                character["constellation"],
+                weapon_id,
+                *[ids.get(x) for x in loader.SLOTS],
+            ),
+        )
+    con.execute(
+        """
+        INSERT INTO Character_Configs (config_name, character, constellation, level, talent, weapon, refine, config)
+        VALUES ('c_HuTao', 'HuTao', 1, '90/90', '10,9,10', 'StaffOfHoma', 1, 'hutao char lvl=90/90;')
+        """
+    )
+    con.execute(
+        "INSERT INTO Rotation_Configs (config_name, config) VALUES ('r', 'hutao attack;')"
+    )
+    con.execute(
+        """
+        INSERT INTO Full_Configs (config_name, character1, rotation)
+        VALUES ('team', 'c_HuTao', 'r')
+        """
+    )
+
+
+@pytest.fixture
+def good():
+    good = good_export(0)
+    # scanners write unused substat slots with an empty key
+    good["artifacts"][0]["substats"].append({"key": "", "value": 0})
+    return good
+
+
+@pytest.fixture
+def baseline(database, monkeypatch, good):
+    path = database / "baseline.db"
+    with sqlite3.connect(path) as con:
+        con.executescript(BASELINE_SCHEMA)
+        baseline_export(con, copy.deepcopy(good))
+    con.close()
+    db.close_connection()
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    return path
+
+
+def columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [x[1] for x in con.execute(f"PRAGMA table_info({table})")]
+
+
+def test_baseline_database_is_migrated(baseline, good):
+    with sqlite3.connect(baseline) as con:
+        substats = {
+            artifact: [x for x in json.loads(text)["substats"] if x["key"]]
+            for artifact, text in con.execute("SELECT id, substats FROM Artifacts")
+        }
+        artifacts = con.execute(
+            "SELECT id, setKey, rarity, level, slotKey, mainStat FROM Artifacts"
+        ).fetchall()
+        characters = con.execute("SELECT * FROM Characters").fetchall()
+    con.close()
+
+    loader.create_table()
+
+    con = db.get_connection()
+    assert con.execute("SELECT MAX(version) FROM Schema_Version").fetchone() == (
+        len(loader.MIGRATIONS),
+    )
+    assert "substats" not in columns(con, "Artifacts")
+    assert "fingerprint" in columns(con, "Artifacts")
+    assert "gear_fingerprint" in columns(con, "Character_Configs")
+
+    rows = con.execute(
+        "SELECT artifact, position, key, value FROM Artifact_Substats ORDER BY artifact, position"
+    ).fetchall()
+    assert rows == [
+        (artifact, position, x["key"], x["value"])
+        for artifact, items in sorted(substats.items())
+        for position, x in enumerate(items)
+    ]
+    assert len(rows) == 4 * len(artifacts)
+    assert (
+        con.execute(
+            "SELECT id, setKey, rarity, level, slotKey, mainStat FROM Artifacts"
+        ).fetchall()
+        == artifacts
+    )
+    assert [x[:12] for x in con.execute("SELECT * FROM Characters")] == characters
+    assert con.execute(
+        "SELECT config_name, gear_fingerprint FROM Character_Configs"
+    ).fetchall() == [("c_HuTao", None)]
+    assert con.execute("SELECT character1, rotation FROM Full_Configs").fetchall() == [
+        ("c_HuTao", "r")
+    ]
+
+    # running them again changes nothing
+    loader.create_table()
+    assert con.execute("SELECT COUNT(*) FROM Schema_Version").fetchone() == (
+        len(loader.MIGRATIONS),
+    )
+
+
+def test_incremental_export_after_migration(baseline, good):
+    loader.create_table()
+
+    import_export(good, incremental=True)
+    migrated = snapshot()
+
+    assert migrated == full_snapshot(good)
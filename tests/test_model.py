@@ -0,0 +1,151 @@
+# CharacterBlock text round trips through model.parse, and the canonical
+# form stays the same bytes whatever order or process built it
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import model
+
+SIM_STATS = list(model.STAT_ORDER)
+SETS = ["crimsonwitchofflames", "emblemofseveredfate", "gildeddreams", "tom"]
+
+
+def block(seed: int, digits: int = model.PRECISION) -> model.CharacterBlock:
+    r = random.Random(seed)
+
+    def value() -> int | float:
+        if r.random() < 0.2:
+            return r.randint(0, 5000)
+        return round(r.uniform(-1, 3000), r.randint(0, digits))
+
+    return model.CharacterBlock(
+        r.choice(["hutao", "xingqiu", "yelan", "zhongli"]),
+        f"{r.randint(1, 90)}/90",
+        r.randint(0, 6),
+        f"{r.randint(1, 10)},{r.randint(1, 10)},{r.randint(1, 10)}",
+        model.Weapon(
+            r.choice(["staffofhoma", "thecatch"]),
+            r.randint(1, 5),
+            f"{r.randint(1, 90)}/90",
+        ),
+        {x: r.choice([2, 4]) for x in r.sample(SETS, r.randint(0, 2))},
+        {x: value() for x in r.sample(SIM_STATS, r.randint(1, 5))},
+        {x: value() for x in r.sample(SIM_STATS, r.randint(0, 10))},
+    )
+
+
+def shuffled(b: model.CharacterBlock, seed: int) -> model.CharacterBlock:
+    r = random.Random(seed)
+
+    def shuffle(d: dict) -> dict:
+        items = list(d.items())
+        r.shuffle(items)
+        return dict(items)
+
+    return model.CharacterBlock(
+        b.name,
+        b.lvl,
+        b.cons,
+        b.talent,
+        b.weapon,
+        shuffle(b.sets),
+        shuffle(b.main_stats),
+        shuffle(b.substats),
+    )
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_parse_serialize_round_trip(canonical):
+    for seed in range(200):
+        b = block(seed)
+        text = b.serialize(canonical)
+
+        assert model.parse(text) == [b]
+        assert model.diff(model.parse(text)[0], b) == []
+
+
+def test_canonical_text_is_a_fixed_point():
+    # more digits than PRECISION are rounded once, then kept as they are
+    for seed in range(200):
+        text = block(seed, digits=12).serialize(True)
+        assert model.parse(text)[0].serialize(True) == text
+
+
+def test_team_round_trip():
+    blocks = [block(seed) for seed in range(4)]
+    for i, b in enumerate(blocks):
+        b.name = f"char{i}"
+    team = model.TeamConfig(
+        blocks, "options iteration=1000;\nwhile 1 {\n  char0 attack;\n}\n"
+    )
+
+    for canonical in (False, True):
+        assert model.parse(team.serialize(canonical)) == blocks
+
+
+def test_canonical_ignores_order():
+    for seed in range(50):
+        b = block(seed, digits=12)
+        text = b.serialize(True)
+        for other in range(5):
+            assert shuffled(b, other).serialize(True) == text
+            assert shuffled(b, other).digest() == b.digest()
+
+
+def test_canonical_is_stable_across_processes():
+    # nothing in the canonical text may depend on hash randomization
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import test_model; "
+        "print(test_model.block(7, digits=12).digest(), end='')"
+    )
+    tests = os.path.dirname(__file__)
+    digests = {
+        subprocess.run(
+            [sys.executable, "-c", code, tests],
+            capture_output=True,
+            text=True,
+            check=True,
+            env={
+                **os.environ,
+                "PYTHONHASHSEED": seed,
+                "PYTHONPATH": os.path.join(tests, os.pardir, "src"),
+            },
+        ).stdout
+        for seed in ("1", "2", "3")
+    }
+    assert digests == {block(7, digits=12).digest()}
+
+
+@pytest.mark.parametrize(
+    "value, text",
+    [
+        (3, "3"),
+        (3.0, "3"),
+        (12.30, "12.3"),
+        (0.000001, "0.000001"),
+        (0.1234564, "0.123456"),
+        (0.1234566, "0.123457"),
+        (1.0000004, "1"),
+        (2.5e-7, "0"),
+        (-1e-9, "0"),
+        (-0.5, "-0.5"),
+        (1e20, "100000000000000000000"),
+    ],
+)
+def test_format_number_precision(value, text):
+    assert model.PRECISION == 6
+    assert model.format_number(value) == text
+
+
+def test_diff_ignores_noise_below_precision():
+    old = block(3)
+    new = block(3)
+    key = next(iter(new.substats))
+    new.substats[key] = old.substats[key] + 1e-8
+    assert model.diff(old, new) == []
+
+    new.substats[key] = old.substats[key] + 1e-5
+    assert [(x.section, x.key) for x in model.diff(old, new)] == [("sub", key)]
@@ -0,0 +1,113 @@
+# JSONStream against json.loads, with chunks small enough that every token
+# ends up split across reads at some point
+#
+#   python -m pytest tests
+import gzip
+import io
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import results
+
+TRICKY = ['a"b\\c', "é\n}{][,", '\\"', "", "☃ \\u0041", 1, -2.5e-3, 1e10, True, None]
+
+
+def noise(r: random.Random, depth: int = 0):
+    # values the selector skips, with brackets and quotes inside strings
+    if depth > 3 or r.random() < 0.3:
+        return r.choice(TRICKY)
+    if r.random() < 0.5:
+        return [noise(r, depth + 1) for _ in range(r.randint(0, 4))]
+    return {f'k{i}"}}': noise(r, depth + 1) for i in range(r.randint(0, 4))}
+
+
+def document(seed: int) -> dict:
+    r = random.Random(seed)
+    return {
+        "debug": [noise(r) for _ in range(5)],
+        "sim_version": "v2.1 é",
+        "config_file": 'hutao char lvl=90/90;\n# "quoted" {braces}\n',
+        "character_details": [
+            {"stats": noise(r), "name": name, "weapon": {"name": '"x"'}}
+            for name in ("hutao", "xingqiu", "zhongli")
+        ],
+        "statistics": {
+            "warnings": noise(r),
+            "iterations": 1000,
+            "duration": {"mean": 90.5, "min": 90},
+            "dps": {"mean": 42000.123, "min": 1, "max": 2, "sd": 0.5},
+            "damage_buckets": [noise(r) for _ in range(5)],
+            "character_dps": [{"mean": 1.5, "sd": 0.1}, {"mean": 2.5}, {}],
+        },
+        "zz": noise(r),
+    }
+
+
+def selected(data: dict) -> dict:
+    statistics = data["statistics"]
+    return {
+        "sim_version": data["sim_version"],
+        "config_file": data["config_file"],
+        "character_details": [{"name": x["name"]} for x in data["character_details"]],
+        "statistics": {
+            key: statistics[key]
+            for key in ("iterations", "duration", "dps", "character_dps")
+        },
+    }
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7, 16, 64])
+def test_select_matches_json_loads(monkeypatch, chunk):
+    monkeypatch.setattr(results.JSONStream, "CHUNK", chunk)
+    for seed in range(10):
+        data = document(seed)
+        for text in (
+            json.dumps(data),
+            json.dumps(data, indent=2),
+            json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+        ):
+            stream = results.JSONStream(io.StringIO(text))
+            assert stream.select(results.RESULT_FIELDS) == selected(json.loads(text))
+
+
+def test_open_result_reads_gzip(tmp_path, monkeypatch):
+    monkeypatch.setattr(results.JSONStream, "CHUNK", 7)
+    data = document(0)
+    plain = tmp_path / "plain.json"
+    plain.write_text(json.dumps(data), encoding="utf-8")
+    zipped = tmp_path / "zipped.json"
+    with gzip.open(zipped, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+    assert results.extract(str(plain)) == selected(data)
+    assert results.extract(str(zipped)) == selected(data)
+
+
+def test_ingest_skips_unparseable_configs(database):
+    out_dir = database / "out"
+    out_dir.mkdir()
+    statistics = {"dps": {"mean": 1.0}, "character_dps": [{"mean": 1.0}]}
+    (out_dir / "broken.json").write_text(
+        json.dumps({"config_file": "hutao add stats hp=1;", "statistics": statistics}),
+        encoding="utf-8",
+    )
+    (out_dir / "truncated.json").write_text('{"statistics": {', encoding="utf-8")
+    (out_dir / "good.json").write_text(
+        json.dumps(
+            {
+                "config_file": "hutao char lvl=90/90 cons=0 talent=9,9,9;\n",
+                "character_details": [{"name": "hutao"}],
+                "statistics": statistics,
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    assert results.ingest_directory(str(out_dir)) == ["good"]
+    assert [x["config_name"] for x in results.ranking()] == ["good"]
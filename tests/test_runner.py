@@ -0,0 +1,60 @@
+# local runs of gcsim_stub.py through run_batch and the result cache
+import os
+
+import db
+import runner
+
+from test_worker import STUB
+
+
+def test_cache_keeps_files_on_disk(database, tmp_path, monkeypatch):
+    calls = []
+    identity = runner.exe_identity
+    monkeypatch.setattr(
+        runner, "exe_identity", lambda path: calls.append(path) or identity(path)
+    )
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    configs = {f"c{i}": f"config {i}\n" for i in range(4)}
+
+    first = runner.run_batch(STUB, configs, str(out_dir), workers=4)
+    assert calls == [STUB]
+    assert not any(x.get("cached") for x in first.values())
+
+    with db.get_connection() as con:
+        rows = con.execute(
+            "SELECT cache_key, output_path, result_path, size FROM Sim_Cache"
+        ).fetchall()
+    assert len(rows) == 4
+    for key, output_path, result_path, size in rows:
+        assert (output_path, result_path) == (f"{key}.txt", f"{key}.json")
+        files = [
+            os.path.join(runner.cache_dir(), x) for x in (output_path, result_path)
+        ]
+        assert size == sum(os.path.getsize(x) for x in files)
+
+    for name in configs:
+        os.remove(out_dir / f"{name}.json")
+    second = runner.run_batch(STUB, configs, str(out_dir), workers=4)
+    for name, result in second.items():
+        assert result["cached"]
+        assert result["output"] == first[name]["output"]
+        assert (out_dir / f"{name}.json").read_text(encoding="utf-8")
+
+    runner.clear_cache()
+    assert not os.path.exists(runner.cache_dir())
+    third = runner.run_batch(STUB, configs, str(out_dir), workers=4)
+    assert not any(x.get("cached") for x in third.values())
+
+
+def test_missing_cache_file_is_a_miss(database, tmp_path):
+    out_path = str(tmp_path / "c.json")
+    runner.run_sim(STUB, "config\n", out_path)
+    for name in os.listdir(runner.cache_dir()):
+        if name.endswith(".json"):
+            os.remove(os.path.join(runner.cache_dir(), name))
+
+    result = runner.run_sim(STUB, "config\n", out_path)
+
+    assert result["returncode"] == 0
+    assert not result.get("cached")
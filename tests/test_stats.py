@@ -0,0 +1,54 @@
+# main_stat_matrix with numpy against the plain list path it falls back to
+import pytest
+
+import stats
+import util
+
+
+def every_main_stat() -> tuple[list[int], list[int], list[int]]:
+    rarities, ids, levels = [], [], []
+    for rarity in range(util.MAIN_STAT_RARITIES):
+        for stat_id in range(len(util.STAT_KEYS)):
+            count = util.main_stat_levels[rarity * len(util.STAT_KEYS) + stat_id]
+            for level in range(count):
+                rarities.append(rarity)
+                ids.append(stat_id)
+                levels.append(level)
+    return rarities, ids, levels
+
+
+def test_numpy_matches_lists(monkeypatch):
+    pytest.importorskip("numpy")
+    columns = every_main_stat()
+    assert columns[0]
+
+    result = stats.main_stat_matrix(*columns)
+    assert stats.main_stat_matrix([], [], []).shape == (0, stats.WIDTH)
+    monkeypatch.setattr(stats, "np", None)
+    expected = stats.main_stat_matrix(*columns)
+
+    assert result.tolist() == expected
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+@pytest.mark.parametrize(
+    "bad, error",
+    [
+        ((5, util.STAT_IDS["hp"], 21), IndexError),
+        ((5, util.STAT_IDS["hp"], -1), IndexError),
+        ((4, util.STAT_IDS["hp"], 17), IndexError),
+        ((6, util.STAT_IDS["hp"], 0), KeyError),
+        ((-1, util.STAT_IDS["hp"], 0), KeyError),
+        ((5, len(util.STAT_KEYS), 0), KeyError),
+        ((5, -1, 0), KeyError),
+        ((5, util.STAT_IDS["def"], 0), KeyError),
+    ],
+)
+def test_out_of_range_raises(monkeypatch, numpy, bad, error):
+    if numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(stats, "np", None)
+    good = (5, util.STAT_IDS["atk"], 20)
+    with pytest.raises(error):
+        stats.main_stat_matrix(*zip(good, bad, good))
@@ -0,0 +1,167 @@
+# worker.WorkerServer on a free local port, running gcsim_stub.py in place of
+# gcsim, driven through runner's remote side
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import runner
+import worker
+
+STUB = os.path.join(os.path.dirname(__file__), "gcsim_stub.py")
+OPTIONS = runner.make_options_string()
+
+
+@pytest.fixture
+def start_worker(monkeypatch):
+    monkeypatch.setattr(runner, "worker_token", None)
+    servers = []
+
+    def start(slots: int = 1, token: str | None = None) -> str:
+        server = worker.WorkerServer(("127.0.0.1", 0), STUB, slots, token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def read_result(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_batch_spreads_over_workers(start_worker, tmp_path):
+    addresses = [start_worker(), start_worker()]
+    configs = {f"c{i}": f"# stub sleep=0.3\nconfig {i}\n" for i in range(4)}
+
+    results = runner.run_batch(
+        STUB, configs, str(tmp_path), options=OPTIONS, use_cache=False, remote=addresses
+    )
+
+    assert {x["returncode"] for x in results.values()} == {0}
+    assert {x["worker"] for x in results.values()} == set(addresses)
+    for name, config in configs.items():
+        assert read_result(tmp_path / f"{name}.json")["config_file"] == config
+        assert "stub running -substatOptimFull" in results[name]["output"]
+
+
+def test_busy_worker_is_waited_for(start_worker, tmp_path):
+    address = start_worker(slots=1)
+    pool = runner.connect_workers([address])
+    first = {}
+    thread = threading.Thread(
+        target=lambda: first.update(
+            runner.run_remote(
+                runner.connect_workers([address]),
+                "# stub sleep=0.5\n",
+                str(tmp_path / "first.json"),
+                use_cache=False,
+            )
+        )
+    )
+    thread.start()
+    while thread.is_alive() and runner.worker_request(address, "/status")["busy"] == 0:
+        time.sleep(0.02)
+
+    result = runner.run_remote(
+        pool, "second\n", str(tmp_path / "second.json"), use_cache=False
+    )
+    thread.join()
+
+    assert first["returncode"] == 0
+    assert result["returncode"] == 0
+    assert result["worker"] == address
+    assert pool[address]["retry_at"] == 0.0
+
+
+def test_cancel_reaches_worker(start_worker, tmp_path):
+    address = start_worker()
+    pool = runner.connect_workers([address])
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.update(
+            runner.run_remote(
+                pool,
+                "# stub sleep=30\n",
+                str(tmp_path / "slow.json"),
+                use_cache=False,
+                name="slow",
+            )
+        )
+    )
+    thread.start()
+    while thread.is_alive() and runner.worker_request(address, "/status")["busy"] == 0:
+        time.sleep(0.02)
+
+    started = time.monotonic()
+    assert runner.cancel("slow")
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 10
+    assert result["returncode"] != 0
+    assert result["stopped"] == "cancelled"
+    assert runner.worker_request(address, "/status")["busy"] == 0
+
+
+def test_quiet_long_job_is_not_lost(start_worker, tmp_path, monkeypatch):
+    # the heartbeat keeps a job longer than the silence timeout alive
+    monkeypatch.setattr(runner, "WORKER_HEARTBEAT", 0.1)
+    monkeypatch.setattr(runner, "WORKER_SILENCE_TIMEOUT", 0.5)
+    address = start_worker()
+    pool = runner.connect_workers([address])
+
+    result = runner.run_remote(
+        pool, "# stub sleep=1.5\n", str(tmp_path / "long.json"), use_cache=False
+    )
+
+    assert result["returncode"] == 0
+    assert pool[address]["retry_at"] == 0.0
+
+
+def test_worker_token_is_checked(start_worker, tmp_path, monkeypatch):
+    address = start_worker(token="secret")
+
+    monkeypatch.setattr(runner, "worker_token", "wrong")
+    assert runner.connect_workers([address]) == {}
+    with pytest.raises(ConnectionError):
+        runner.run_batch(STUB, {"c": "config\n"}, str(tmp_path), remote=[address])
+
+    monkeypatch.setattr(runner, "worker_token", "secret")
+    pool = runner.connect_workers([address])
+    assert list(pool) == [address]
+    monkeypatch.setattr(runner, "worker_token", "wrong")
+    result = runner.run_remote(
+        pool, "config\n", str(tmp_path / "c.json"), use_cache=False
+    )
+
+    # turned down, not a fault of the worker: no retries, no skip
+    assert result["returncode"] is None
+    assert not result.get("skipped")
+    assert "Bad worker token." in result["output"]
+    assert pool[address]["retry_at"] == 0.0
+
+
+@pytest.mark.parametrize(
+    "options",
+    ["-out /tmp/elsewhere.json", OPTIONS + " -s", '-substatOptimFull -options="x=1;"'],
+)
+def test_unsupported_options_are_refused(start_worker, tmp_path, options):
+    address = start_worker()
+    pool = runner.connect_workers([address])
+
+    result = runner.run_remote(
+        pool, "config\n", str(tmp_path / "c.json"), options=options, use_cache=False
+    )
+
+    assert result["returncode"] is None
+    assert not result.get("skipped")
+    assert "Unsupported gcsim options." in result["output"]
+    assert pool[address]["retry_at"] == 0.0
+    assert not os.path.exists(tmp_path / "c.json")